@@ -11,124 +11,416 @@ import sys
 import time
 
 from argparse import ArgumentParser
-
+from collections import namedtuple
 from multiprocessing import Process, Manager, cpu_count
-from pygit2 import Repository, GIT_SORT_REVERSE, GIT_SORT_TOPOLOGICAL
+from pygit2 import Commit, Repository, GIT_SORT_REVERSE, GIT_SORT_TOPOLOGICAL
+from pygit2 import GIT_DELTA_ADDED, GIT_DELTA_COPIED, GIT_DELTA_DELETED
 from tqdm import tqdm
 
+from churn_matrix import ChurnMatrix
+from commit_diffs import (MERGE_POLICIES, DEFAULT_MERGE_POLICY, get_parent_diff,
+                          get_patches, get_combined_paths, shard_commits,
+                          add_guard_arguments, get_guard)
+from developer_churns import DeveloperChurns, DEFAULT_WINDOWS
+from git_log_stream import ZERO_OID, read_numstat_log
+from line_count_cache import LineCountCache, DEFAULT_CACHE_SIZE, count_lines
+from time_windows import parse_windows
+
 # Global variables
 MANAGER = Manager()
 RES = MANAGER.dict()
+FILE_CHURNS = MANAGER.dict()
+DEVELOPER_CHURNS = MANAGER.dict()
+
+DEFAULT_CHECKPOINT_INTERVAL = 1000
+
+BACKENDS = ["pygit2", "git-log"]
+GITLINK_MODE = "160000"
 
+CommitChurn = namedtuple("CommitChurn",
+                         ["row", "file_churns", "added", "deleted", "files"])
+
+
+class FileCounter:
+    """
+    Keeps a running count of the files (and optionally the total lines of code)
+    in the tree of the last seen commit. The count is updated from the added and
+    deleted deltas of each diff, so the cost per commit is proportional to the
+    number of changed files instead of the size of the repository.
+    """
 
-def parse_code_churns(pid, repo_path, branch, start, stop=-1):
+    def __init__(self, repo, line_cache,
+                 checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL,
+                 track_loc=False):
+        self.repo = repo
+        self.line_cache = line_cache
+        self.checkpoint_interval = checkpoint_interval
+        self.track_loc = track_loc
+
+        self.commit_id = None
+        self.num_files = 0
+        self.total_loc = 0
+        self.updates = 0
+
+    def reset(self, commit):
+        """
+        Recount everything by walking the whole tree of a commit.
+        """
+        self.commit_id = commit.id
+        self.num_files = count_files(commit.tree, self.repo)
+        if self.track_loc:
+            self.total_loc = count_tree_lines_of_code(commit.tree, self.repo,
+                                                      self.line_cache)
+
+    def update(self, commit, parent, diff):
+        """
+        Move the count from the parent to the commit using the diff between
+        them. If the parent isn't the last counted commit, the parent is
+        recounted from scratch first. A root commit has no parent and starts
+        from an empty tree.
+        """
+        if parent is None:
+            self.num_files = 0
+            self.total_loc = 0
+        elif self.commit_id != parent.id:
+            self.reset(parent)
+
+        for delta in diff.deltas:
+            if delta.status in (GIT_DELTA_ADDED, GIT_DELTA_COPIED):
+                self.num_files += 1
+                lines = self._lines(delta.new_file)
+            elif delta.status == GIT_DELTA_DELETED:
+                self.num_files -= 1
+                lines = -self._lines(delta.old_file)
+            else:
+                lines = (self._lines(delta.new_file) -
+                         self._lines(delta.old_file))
+
+            self.total_loc += lines
+
+        self.commit_id = commit.id
+        self.updates += 1
+
+        if self.checkpoint_interval > 0 and \
+           self.updates % self.checkpoint_interval == 0:
+            self.checkpoint(commit)
+
+    def checkpoint(self, commit):
+        """
+        Compare the running count with a full walk and correct any drift.
+        """
+        num_files, total_loc = self.num_files, self.total_loc
+        self.reset(commit)
+
+        if (num_files, total_loc) != (self.num_files, self.total_loc):
+            print("Running file count drifted at {}: got ({}, {}), "
+                  "expected ({}, {})".format(commit.hex, num_files, total_loc,
+                                             self.num_files, self.total_loc))
+
+    def _lines(self, dfile):
+        if not self.track_loc:
+            return 0
+        try:
+            return self.line_cache.get(dfile.id)
+        except Exception as _:
+            return 0
+
+
+def parse_code_churns(pid, repo_path, commits, cache_path=None,
+                      cache_size=DEFAULT_CACHE_SIZE, incremental=False,
+                      checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL,
+                      track_loc=False, merge_policy=DEFAULT_MERGE_POLICY,
+                      file_churns=False, windows=None, guard=None):
     """
     Function that is intended to be runned by a process. It extracts the code churns
-    for a set of commits and stores them in the RES dict.
+    for a set of commits and stores them in the RES dict. Each commit is diffed
+    against its own parent(s) according to the merge policy. In incremental mode the
+    number of files is kept up to date from the diffs instead of walking every tree.
+    If file churns are asked for, the added and deleted lines per file are stored in
+    the FILE_CHURNS dict. If windows are given, the churn per author and time window
+    is stored in the DEVELOPER_CHURNS dict.
     """
     repo = Repository(repo_path)
+    line_cache = LineCountCache(repo, cache_size, cache_path)
+
+    file_counter = None
+    if incremental or track_loc:
+        file_counter = FileCounter(repo, line_cache, checkpoint_interval,
+                                   track_loc)
+
+    developer_churns = DeveloperChurns(windows) if windows else None
+
+    code_churns = []
+    commit_file_churns = {}
+    for commit_hex in tqdm(commits, position=pid):
+        commit = repo.get(commit_hex)
+        churn = get_commit_churn(repo, commit, line_cache, merge_policy,
+                                 file_counter, guard)
+        if churn is None:
+            continue
+        code_churns.append(churn.row)
+        if file_churns:
+            commit_file_churns[commit_hex] = churn.file_churns
+        if developer_churns is not None:
+            developer_churns.add(commit.author.email, commit.commit_time,
+                                 churn.added, churn.deleted, churn.files)
+
+    line_cache.close()
+    RES[pid] = code_churns
+    if file_churns:
+        FILE_CHURNS[pid] = commit_file_churns
+    if developer_churns is not None:
+        DEVELOPER_CHURNS[pid] = developer_churns.counters
 
-    head = repo.references.get(branch)
-    commits = list(
-        repo.walk(head.target, GIT_SORT_TOPOLOGICAL | GIT_SORT_REVERSE))
-
-    start = start - 1 if (start > 0) else start
-    commits = commits[start:stop] if (stop != -1) else commits[start:]
-
-    code_churns = [[] for c in range(len(commits))]
-    for i, commit in enumerate(tqdm(commits[1:], position=pid)):
-        diff = repo.diff(commits[i], commit)
 
-        tree = commit.tree
-        patches = [p for p in diff]
-        stats = diff.stats
+def get_commit_churn(repo, commit, line_cache, merge_policy=DEFAULT_MERGE_POLICY,
+                     file_counter=None, guard=None):
+    """
+    Extract the code churns of a single commit by diffing it against its parent(s).
+    Returns the row of code churns, the added and deleted lines of each changed file
+    and the absolute churn, or None if the commit is a merge that is skipped. The
+    file count is taken from the file counter if one is given, otherwise the tree is
+    walked. Commits that the guard finds too large are flagged and only get their
+    churn from the diff stats, without creating any patches or reading any blobs.
+    """
+    parent_diff = get_parent_diff(repo, commit, merge_policy)
+    if parent_diff is None:
+        return None
+    parent, diff = parent_diff
+
+    large = None
+    patches = None
+    if guard is not None and guard.enabled:
+        large, patches = guard.check(diff)
+        if large:
+            return get_large_commit_churn(repo, commit, parent, diff,
+                                          merge_policy, guard, file_counter)
+
+    tree = commit.tree
+    patches = get_patches(repo, commit, diff, merge_policy, patches)
+
+    # Count the total lines of code and find the biggest file that have been changed
+    total_tloc = 0
+    line_of_code_old = 0
+    for patch in patches:
+        if patch.delta.is_binary:
+            continue
+        new_file = patch.delta.new_file
+
+        # Total lines of code
+        total_tloc += get_file_lines_of_code(repo, tree, new_file, line_cache)
+
+        old_file = patch.delta.old_file
+        # Total lines of code in the old file
+        line_of_code_old = max(
+            line_of_code_old,
+            get_file_lines_of_code(repo, tree, old_file, line_cache))
+
+    file_churns = [(p.delta.new_file.path, p.line_stats[1], p.line_stats[2])
+                   for p in patches if not p.delta.is_binary]
+
+    # Churned lines of code
+    cloc = sum([p.line_stats[1] for p in patches])
+    # Deleted lines of code
+    dloc = sum([p.line_stats[2] for p in patches])
+
+    # Churned files
+    files_churned = len(patches)
+
+    num_files, total_loc = get_file_count(repo, commit, parent, diff,
+                                          file_counter)
+
+    row = make_churn_row(commit.hex, cloc, dloc, files_churned, total_tloc,
+                         num_files, line_of_code_old, total_loc, large)
+    return CommitChurn(row, file_churns, cloc, dloc, files_churned)
+
+
+def get_large_commit_churn(repo, commit, parent, diff, merge_policy, guard,
+                           file_counter):
+    """
+    Extract the code churns of a large commit from the diff stats and the delta
+    headers only. The lines of code of the changed files are not counted and, in
+    header mode, neither are the added and deleted lines. With the combine
+    policy, only the files of a merge that differ from every parent count, and
+    their lines are summed while the patches are streamed one at a time.
+    """
+    changed = None
+    if merge_policy == "combine" and len(commit.parents) > 1:
+        changed = get_combined_paths(repo, commit)
+
+    cloc, dloc = 0, 0
+    if changed is None:
+        files_churned = len(diff)
+        stats = guard.get_stats(diff)
+        if stats is not None:
+            cloc, dloc = stats.insertions, stats.deletions
+    else:
+        files_churned = len(
+            [d for d in diff.deltas if d.new_file.path in changed])
+        if guard.mode == "stats":
+            for patch in diff:
+                if patch.delta.new_file.path in changed:
+                    cloc += patch.line_stats[1]
+                    dloc += patch.line_stats[2]
+
+    num_files, total_loc = get_file_count(repo, commit, parent, diff,
+                                          file_counter)
+
+    row = make_churn_row(commit.hex, cloc, dloc, files_churned, 0, num_files, 0,
+                         total_loc, True)
+    return CommitChurn(row, [], cloc, dloc, files_churned)
+
+
+def get_file_count(repo, commit, parent, diff, file_counter):
+    """
+    Get the number of files of a commit and, if it is tracked, the total lines of
+    code. The file counter is used if one is given, otherwise the tree is walked.
+    """
+    if file_counter is None:
+        return count_files(commit.tree, repo), None
 
-        # Count the total lines of code and find the biggest file that have been changed
-        total_tloc = 0
-        line_of_code_old = 0
-        for patch in patches:
-            if patch.delta.is_binary:
-                continue
-            new_file = patch.delta.new_file
+    file_counter.update(commit, parent, diff)
+    if file_counter.track_loc:
+        return file_counter.num_files, file_counter.total_loc
+    return file_counter.num_files, None
 
-            # Total lines of code
-            total_tloc += get_file_lines_of_code(repo, tree, new_file)
 
-            old_file = patch.delta.old_file
-            # Total lines of code in the old file
-            line_of_code_old = max(
-                line_of_code_old, get_file_lines_of_code(repo, tree, old_file))
+def get_commits_churns(repo_path, commit_ids, cache_path=None,
+                       cache_size=DEFAULT_CACHE_SIZE, track_loc=False,
+                       merge_policy=DEFAULT_MERGE_POLICY, matrix_path=None,
+                       guard=None):
+    """
+    Extract the code churns of an explicit list of commits without walking the
+    branch. Every commit is diffed directly against its parent(s), so the cost
+    depends on the number of requested commits and not on the length of the
+    history. The rows are returned in the order of the given commits.
+    """
+    repo = Repository(repo_path)
+    line_cache = LineCountCache(repo, cache_size, cache_path)
 
-        # Churned lines of code
-        cloc = stats.insertions
-        # Deleted lines of code
-        dloc = stats.deletions
+    file_counter = None
+    if track_loc:
+        file_counter = FileCounter(repo, line_cache, 0, track_loc)
 
-        # Churned files
-        files_churned = len(patches)
+    churns = []
+    file_churns = {}
+    for commit_id in tqdm(commit_ids):
+        commit = repo.revparse_single(commit_id).peel(Commit)
 
-        # File count
-        num_files = count_files(tree, repo)
+        churn = get_commit_churn(repo, commit, line_cache, merge_policy,
+                                 file_counter, guard)
+        if churn is not None:
+            churns.append(churn.row)
+            file_churns[commit.hex] = churn.file_churns
 
-        # Apply relative code churns
-        measure_one = float(cloc) / total_tloc if (total_tloc > 0) else float(cloc)
-        measure_two = float(dloc) / total_tloc if (total_tloc > 0) else float(cloc)
-        measure_three = (float(files_churned) / num_files if (num_files > 0)
-                         else float(files_churned))
+    line_cache.close()
 
-        line_of_code_old = float(line_of_code_old)
+    if matrix_path is not None:
+        save_churn_matrix(churns, file_churns, matrix_path)
+    return churns
 
-        # Churn features
-        code_churns[i].append(str(commit.hex))
-        code_churns[i].append(str(measure_one))
-        code_churns[i].append(str(measure_two))
-        code_churns[i].append(str(measure_three))
-        code_churns[i].append(str(line_of_code_old))
 
-    RES[pid] = code_churns
+def parse_commits(commit_file):
+    """
+    Read commits from a file with one SHA-1 per line.
+    """
+    with open(commit_file, 'r') as cfile:
+        return [line.strip() for line in cfile if line.strip()]
 
 
-def count_files(tree, repo):
+def make_churn_row(commit_hex, cloc, dloc, files_churned, total_tloc, num_files,
+                   line_of_code_old, total_loc=None, large=None):
+    """
+    Turn the counts of a commit into its row of relative code churns. The total
+    lines of code and the large commit flag are only added if they are given.
     """
-    Count how many files there are in a repository.
+    # Apply relative code churns
+    measure_one = float(cloc) / total_tloc if (total_tloc > 0) else float(cloc)
+    measure_two = float(dloc) / total_tloc if (total_tloc > 0) else float(cloc)
+    measure_three = (float(files_churned) / num_files if (num_files > 0)
+                     else float(files_churned))
+
+    line_of_code_old = float(line_of_code_old)
+
+    # Churn features
+    churn = []
+    churn.append(str(commit_hex))
+    churn.append(str(measure_one))
+    churn.append(str(measure_two))
+    churn.append(str(measure_three))
+    churn.append(str(line_of_code_old))
+    if total_loc is not None:
+        churn.append(str(float(total_loc)))
+    if large is not None:
+        churn.append("1" if large else "0")
+    return churn
+
+
+def count_files(tree, repo, counted=None):
     """
+    Count how many files there are in a repository. Subtrees that occur more
+    than once are only walked once.
+    """
+    if counted is None:
+        counted = {}
+    if tree.id in counted:
+        return counted[tree.id]
+
     num_files = 0
-    trees = []
-    visited = set()
-    visited.add(tree.id)
-    trees.append(tree)
-
-    while trees:
-        current_tree = trees.pop()
-        for entry in current_tree:
-            if entry.type == "tree":
-                if entry.id not in visited:
-                    trees.append(repo[entry.id])
-                    visited.add(entry.id)
-            else:
-                num_files += 1
+    for entry in tree:
+        if entry.type_str == "tree":
+            num_files += count_files(repo[entry.id], repo, counted)
+        else:
+            num_files += 1
+
+    counted[tree.id] = num_files
     return num_files
 
 
-def get_file_lines_of_code(repo, tree, dfile):
+def count_tree_lines_of_code(tree, repo, line_cache):
     """
-    Count how many lines of code there are in a file.
+    Count the total lines of code of all files in a tree.
+    """
+    tloc = 0
+    for entry in tree:
+        if entry.type_str == "tree":
+            tloc += count_tree_lines_of_code(repo[entry.id], repo, line_cache)
+        elif entry.type_str == "blob":
+            tloc += line_cache.get(entry.id)
+    return tloc
+
+
+def get_file_lines_of_code(repo, tree, dfile, line_cache=None):
+    """
+    Count how many lines of code there are in a file. If a line cache is
+    given, the count is looked up by the OID of the blob.
     """
     tloc = 0
     try:
-        blob = repo[tree[dfile.path].id]
+        oid = tree[dfile.path].id
+        if line_cache is not None:
+            return line_cache.get(oid)
 
-        tloc = len(str(blob.data).split('\\n'))
+        tloc = count_lines(repo[oid].data)
     except Exception as _:
         return tloc
     return tloc
 
 
-def get_code_churns(repo_path, branch):
+def get_code_churns(repo_path, branch, cache_path=None,
+                    cache_size=DEFAULT_CACHE_SIZE, incremental=False,
+                    checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL,
+                    track_loc=False, merge_policy=DEFAULT_MERGE_POLICY,
+                    matrix_path=None, developer_path=None, windows=None,
+                    guard=None):
     """
     General function for extracting code churns. It first extracts the code churns for
     the first commit and then starts a number of processes(equal to the number of cores
     on the computer), which equally extracts the code churns for the remaining commits.
+    If a cache path is given, all processes share an on-disk line count cache. If a
+    matrix path is given, a sparse commit x file churn matrix is saved there as well.
+    If a developer path is given, the churn per author and time window is saved there.
+    Commits that the large commit guard catches are processed from their stats only.
     """
     repo = Repository(repo_path)
 
@@ -152,19 +444,31 @@ def get_code_churns(repo_path, branch):
     code_churns[0].append(str(measure_two))
     code_churns[0].append(str(measure_three))
     code_churns[0].append(str(line_of_code_old))
+    if track_loc:
+        line_cache = LineCountCache(repo, cache_size, cache_path)
+        code_churns[0].append(
+            str(float(count_tree_lines_of_code(initial.tree, repo,
+                                               line_cache))))
+        line_cache.close()
+    if guard is not None and guard.enabled:
+        code_churns[0].append("0")
 
     # Check how many processes that could be spawned
     cpus = cpu_count()
     print("Using {} cpus...".format(cpus))
 
-    # Equally split the commit set into the equally sized parts.
-    quote, remainder = divmod(len(commits), cpus)
+    # Distribute the commits between the processes.
+    commit_hexes = [str(c.hex) for c in commits]
+    shards = shard_commits(commit_hexes[1:], cpus)
 
     processes = [
         Process(
             target=parse_code_churns,
-            args=(i, repo_path, branch, i * quote + min(i, remainder),
-                  (i + 1) * quote + min(i + 1, remainder))) for i in range(cpus)
+            args=(i, repo_path, shards[i], cache_path, cache_size,
+                  incremental, checkpoint_interval, track_loc, merge_policy,
+                  matrix_path is not None,
+                  (windows or DEFAULT_WINDOWS) if developer_path else None,
+                  guard)) for i in range(cpus)
     ]
 
     for process in processes:
@@ -179,28 +483,192 @@ def get_code_churns(repo_path, branch):
     print("Overall processing time {}".format(end_time - start_time))
 
     # Assemble the results
-    churns = []
+    rows = {}
     for _, churn in RES.items():
-        churns.extend(churn)
+        for row in churn:
+            rows[row[0]] = row
 
-    churns = list(reversed(churns))
+    churns = [rows[c] for c in reversed(commit_hexes[1:]) if c in rows]
     churns.append(code_churns[0])
+
+    if matrix_path is not None:
+        file_churns = {}
+        for _, commit_file_churns in FILE_CHURNS.items():
+            file_churns.update(commit_file_churns)
+        save_churn_matrix(churns, file_churns, matrix_path)
+
+    if developer_path is not None:
+        developer_churns = DeveloperChurns(windows)
+        for _, counters in DEVELOPER_CHURNS.items():
+            developer_churns.update(counters)
+        developer_churns.save(developer_path)
+    return churns
+
+
+def save_churn_matrix(churns, file_churns, path):
+    """
+    Save the file churns of each commit as a sparse matrix with one row per row
+    of code churns.
+    """
+    matrix = ChurnMatrix()
+    for row in churns:
+        matrix.add_commit(row[0], file_churns.get(row[0], []))
+    matrix.save(path)
+
+def get_blob_lines_of_code(line_cache, oid, mode):
+    """
+    Count the lines of a blob given its hex OID and file mode. Missing blobs and
+    submodules have no lines.
+    """
+    if oid == ZERO_OID or mode == GITLINK_MODE:
+        return 0
+    try:
+        return line_cache.get(oid)
+    except Exception as _:
+        return 0
+
+
+def get_code_churns_from_log(repo_path, branch, cache_path=None,
+                             cache_size=DEFAULT_CACHE_SIZE, track_loc=False,
+                             merge_policy=DEFAULT_MERGE_POLICY,
+                             matrix_path=None, developer_path=None,
+                             windows=None, guard=None):
+    """
+    Extract the code churns by reading a single streaming git log process. The added
+    and deleted lines come from --numstat and the file counts from the raw changes,
+    so blobs are only read to count the lines of code of the changed files. The file
+    count of each commit is derived from the one of its first parent. If a matrix
+    path is given, a sparse commit x file churn matrix is saved there as well. If a
+    developer path is given, the churn per author and time window is saved there.
+    Commits with more files or changed lines than the large commit guard allows are
+    flagged and their lines of code are not counted.
+    """
+    repo = Repository(repo_path)
+    line_cache = LineCountCache(repo, cache_size, cache_path)
+
+    start_time = time.time()
+
+    flag_large = guard is not None and guard.enabled
+    developer_churns = DeveloperChurns(windows) if developer_path else None
+
+    counts = {}
+    churns = []
+    file_churns = {}
+    for i, log_commit in enumerate(tqdm(read_numstat_log(repo_path, branch))):
+        changes = log_commit.changes
+
+        # File count and total lines of code of the first parent
+        if not log_commit.parents:
+            num_files, total_loc = 0, 0
+        elif log_commit.parents[0] in counts:
+            num_files, total_loc = counts[log_commit.parents[0]]
+        else:
+            parent_tree = repo.get(log_commit.parents[0]).tree
+            num_files = count_files(parent_tree, repo)
+            total_loc = (count_tree_lines_of_code(parent_tree, repo, line_cache)
+                         if track_loc else 0)
+
+        for change in changes:
+            if change.status in ("A", "C"):
+                num_files += 1
+            elif change.status == "D":
+                num_files -= 1
+
+            if track_loc:
+                total_loc += (
+                    get_blob_lines_of_code(line_cache, change.new_id,
+                                           change.new_mode) -
+                    get_blob_lines_of_code(line_cache, change.old_id,
+                                           change.old_mode))
+        counts[log_commit.hex] = (num_files, total_loc)
+
+        if i == 0:
+            churns.append(
+                make_churn_row(log_commit.hex, 0, 0, 1, 0, 1, 0,
+                               total_loc if track_loc else None,
+                               False if flag_large else None))
+            continue
+
+        if len(log_commit.parents) > 1:
+            if merge_policy == "skip":
+                continue
+            if merge_policy == "combine":
+                combined = get_combined_paths(repo, repo.get(log_commit.hex))
+                changes = [c for c in changes if c.path in combined]
+
+        cloc = sum([c.added for c in changes if c.added is not None])
+        dloc = sum([c.deleted for c in changes if c.deleted is not None])
+
+        large = None
+        if flag_large:
+            large = ((guard.max_files is not None and
+                      len(changes) > guard.max_files) or
+                     (guard.max_lines is not None and
+                      cloc + dloc > guard.max_lines))
+
+        # Count the total lines of code and find the biggest file that have been changed
+        total_tloc = 0
+        line_of_code_old = 0
+        for change in changes:
+            if large:
+                break
+            if change.added is None:
+                continue
+            tloc = get_blob_lines_of_code(line_cache, change.new_id,
+                                          change.new_mode)
+            total_tloc += tloc
+            line_of_code_old = max(line_of_code_old, tloc)
+
+        if matrix_path is not None:
+            file_churns[log_commit.hex] = [(c.path, c.added, c.deleted)
+                                           for c in changes
+                                           if c.added is not None]
+
+        if developer_churns is not None:
+            developer_churns.add(log_commit.author, log_commit.time, cloc, dloc,
+                                 len(changes))
+
+        churns.append(
+            make_churn_row(log_commit.hex, cloc, dloc, len(changes),
+                           total_tloc, num_files, line_of_code_old,
+                           total_loc if track_loc else None, large))
+
+    line_cache.close()
+
+    end_time = time.time()
+
+    print("Done")
+    print("Overall processing time {}".format(end_time - start_time))
+
+    churns = list(reversed(churns))
+    if matrix_path is not None:
+        save_churn_matrix(churns, file_churns, matrix_path)
+    if developer_churns is not None:
+        developer_churns.save(developer_path)
     return churns
 
-def save_churns(churns, path="./results/code_churns_features_multithread.csv"):
+
+def save_churns(churns, path="./results/code_churns_features_multithread.csv",
+                track_loc=False, large_commits=False):
     """
     Saves the code churns to a csv file.
     """
+    header = [
+        "commit", "lines_of_code_added", "lines_of_code_deleted",
+        "files_churned", "line_of_code_old"
+    ]
+    if track_loc:
+        header.append("total_lines_of_code")
+    if large_commits:
+        header.append("large_commit")
+
     with open(path, 'w') as csv_file:
         writer = csv.writer(csv_file)
-        writer.writerow([
-            "commit", "lines_of_code_added", "lines_of_code_deleted",
-            "files_churned", "line_of_code_old"
-        ])
+        writer.writerow(header)
 
         for row in churns:
             if row:
-                writer.writerow([row[0], row[1], row[2], row[3], row[4]])
+                writer.writerow(row[:len(header)])
 
 
 if __name__ == "__main__":
@@ -219,6 +687,76 @@ if __name__ == "__main__":
         type=str,
         default="refs/heads/master",
         help="Which branch to use.")
+    PARSER.add_argument(
+        "--line-cache",
+        "-lc",
+        type=str,
+        default=None,
+        help="Path to an on-disk line count cache shared by all processes.")
+    PARSER.add_argument(
+        "--line-cache-size",
+        type=int,
+        default=DEFAULT_CACHE_SIZE,
+        help="Number of line counts to keep in memory per process.")
+    PARSER.add_argument(
+        "--incremental-files",
+        "-if",
+        action="store_true",
+        help="Keep a running file count updated from each diff instead of " +
+        "walking the whole tree of every commit.")
+    PARSER.add_argument(
+        "--checkpoint-interval",
+        type=int,
+        default=DEFAULT_CHECKPOINT_INTERVAL,
+        help="Number of commits between full tree walks that check the " +
+        "running file count for drift. Zero disables the checks.")
+    PARSER.add_argument(
+        "--total-loc",
+        action="store_true",
+        help="Also keep a running total of the lines of code in the " +
+        "repository and write it as an extra column.")
+    PARSER.add_argument(
+        "--merge-policy",
+        "-mp",
+        type=str,
+        choices=MERGE_POLICIES,
+        default=DEFAULT_MERGE_POLICY,
+        help="How merges are diffed: against the first parent, skipped or " +
+        "combined so that only files differing from every parent count.")
+    PARSER.add_argument(
+        "--backend",
+        type=str,
+        choices=BACKENDS,
+        default="pygit2",
+        help="Diff every commit with pygit2 in several processes or read a " +
+        "single streaming git log --numstat.")
+    PARSER.add_argument(
+        "--churn-matrix",
+        "-cm",
+        type=str,
+        default=None,
+        help="Path prefix where a sparse commit x file matrix of added and " +
+        "deleted lines is saved.")
+    PARSER.add_argument(
+        "--commits",
+        "-c",
+        type=str,
+        default=None,
+        help="Path to a file with one commit SHA-1 per line. Only these " +
+        "commits are extracted, each against its own parent(s).")
+    PARSER.add_argument(
+        "--developer-churns",
+        "-dc",
+        type=str,
+        default=None,
+        help="Path where the churn per author and time window is saved.")
+    PARSER.add_argument(
+        "--windows",
+        type=parse_windows,
+        default=DEFAULT_WINDOWS,
+        help="Comma separated sizes in days of the time windows used for " +
+        "the developer churns.")
+    add_guard_arguments(PARSER)
 
     ARGS = PARSER.parse_args()
     REPOPATH = ARGS.repository
@@ -228,5 +766,32 @@ if __name__ == "__main__":
         print("The repository path does not exist!")
         sys.exit(1)
 
-    CHURNS = get_code_churns(REPOPATH, BRANCH)
-    save_churns(CHURNS)
+    if ARGS.commits and (ARGS.developer_churns or ARGS.backend != "pygit2" or
+                         ARGS.incremental_files):
+        PARSER.error("--developer-churns, --backend git-log and " +
+                     "--incremental-files are not supported with --commits")
+
+    GUARD = get_guard(ARGS)
+    if ARGS.backend == "git-log" and not ARGS.commits and \
+       (ARGS.max_blob_size is not None or ARGS.large_commit_mode == "header"):
+        PARSER.error("--max-blob-size and --large-commit-mode header are not " +
+                     "supported with --backend git-log")
+
+    if ARGS.commits:
+        CHURNS = get_commits_churns(REPOPATH, parse_commits(ARGS.commits),
+                                    ARGS.line_cache, ARGS.line_cache_size,
+                                    ARGS.total_loc, ARGS.merge_policy,
+                                    ARGS.churn_matrix, GUARD)
+    elif ARGS.backend == "git-log":
+        CHURNS = get_code_churns_from_log(REPOPATH, BRANCH, ARGS.line_cache,
+                                          ARGS.line_cache_size, ARGS.total_loc,
+                                          ARGS.merge_policy, ARGS.churn_matrix,
+                                          ARGS.developer_churns, ARGS.windows,
+                                          GUARD)
+    else:
+        CHURNS = get_code_churns(REPOPATH, BRANCH, ARGS.line_cache,
+                                 ARGS.line_cache_size, ARGS.incremental_files,
+                                 ARGS.checkpoint_interval, ARGS.total_loc,
+                                 ARGS.merge_policy, ARGS.churn_matrix,
+                                 ARGS.developer_churns, ARGS.windows, GUARD)
+    save_churns(CHURNS, track_loc=ARGS.total_loc, large_commits=GUARD.enabled)
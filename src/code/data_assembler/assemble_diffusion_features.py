@@ -11,133 +11,261 @@ import sys
 import time
 
 from argparse import ArgumentParser
+from array import array
 from multiprocessing import Process, Manager, cpu_count
-from numpy import log2
+
+import numpy as np
 from pygit2 import Repository, GIT_SORT_TOPOLOGICAL, GIT_SORT_REVERSE
 from tqdm import tqdm
 
+from commit_diffs import (MERGE_POLICIES, DEFAULT_MERGE_POLICY, get_parent_diff,
+                          get_patches, get_combined_paths, shard_commits,
+                          add_guard_arguments, get_guard)
+from build_modules import (MODULE_MODES, DEFAULT_MODULE_MODE,
+                           BuildModuleIndex)
+from history_complexity import DEFAULT_HALF_LIFE, get_history_complexity
+from line_count_cache import LineCountCache, DEFAULT_CACHE_SIZE
+from path_trie import PathTrie
+from time_windows import parse_days
+
 MANAGER = Manager()
 RES = MANAGER.dict()
+INITIAL = MANAGER.dict()
+
+# How many subtrees of the initial commit to aim for per process
+SUBTREES_PER_PROCESS = 4
 
 
-def count_diffing_subsystems(subsystems):
+def batch_entropy(file_changes, offsets):
     """
-    Function for counting the number of subsystems in a repository.
+    Count the entropy of the file changes of a batch of commits at once. The
+    changed lines of all files are given as one flat sequence, and offsets holds
+    the index of the first file of each commit. Commits without any changes get
+    an entropy of 0.
     """
-    number = 0
-    for system in subsystems.values():
-        number = number + count_diffing_subsystems(system)
+    changes = np.asarray(file_changes, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    entropy = np.zeros(len(offsets))
+
+    lengths = np.diff(np.append(offsets, len(changes)))
+    nonempty = lengths > 0
+    if not nonempty.any():
+        return entropy
+
+    # reduceat does not handle empty segments, so only reduce over commits that
+    # have at least one file.
+    starts = offsets[nonempty]
+    totals = np.repeat(np.add.reduceat(changes, starts), lengths[nonempty])
 
-    return number + len(subsystems.keys())
+    terms = np.zeros(len(changes))
+    changed = changes > 0
+    probabilities = changes[changed] / totals[changed]
+    terms[changed] = -1 * probabilities * np.log2(probabilities)
 
-def count_entropy(file_changes, total_change):
+    # Adding 0.0 turns the -0.0 of single file commits into 0.0.
+    entropy[nonempty] = np.add.reduceat(terms, starts) + 0.0
+    return entropy
+
+
+def get_depth_features(depths):
     """
-    Function to count entropy for some file changes.
+    Get the max and mean directory depth of a set of files given their
+    depths. A commit without files has a depth of 0.
     """
-    if total_change == 0:
-        return 0
-    return sum([
-        -1 * (float(x) / total_change) * (log2(float(x) / total_change)
-                                          if x > 0 else 0)
-        for x in file_changes
-    ])
+    if not depths:
+        return [str(0.0), str(0.0)]
+    return [str(float(max(depths))), str(float(sum(depths)) / len(depths))]
 
 
-def parse_diffusion_features(pid, repo_path, branch, start, stop=-1):
+def get_large_file_changes(repo, commit, diff, merge_policy, guard):
     """
-    Function to extract diffusion features from a set of commits.
+    Get the path and the number of changed lines of every text file in a large
+    commit without holding all of its patches in memory. The patches are
+    streamed one at a time, and in header mode only the deltas are read and
+    every file gets 0 changed lines.
     """
-    repo = Repository(repo_path)
+    changed = None
+    if merge_policy == "combine" and len(commit.parents) > 1:
+        changed = get_combined_paths(repo, commit)
 
-    head = repo.references.get(branch)
-    commits = list(
-        repo.walk(head.target, GIT_SORT_TOPOLOGICAL | GIT_SORT_REVERSE))
+    if guard.mode == "header":
+        for delta in diff.deltas:
+            if changed is not None and delta.new_file.path not in changed:
+                continue
+            if not delta.is_binary:
+                yield delta.new_file.path, 0
+        return
+
+    for patch in diff:
+        if changed is not None and patch.delta.new_file.path not in changed:
+            continue
+        if patch.delta.is_binary:
+            continue
+        _, addition, deletions = patch.line_stats
+        yield patch.delta.new_file.path, addition + deletions
+
+
+def parse_diffusion_features(pid, repo_path, commits,
+                             merge_policy=DEFAULT_MERGE_POLICY, guard=None,
+                             initial_trees=None, initial_depth=0,
+                             cache_path=None,
+                             cache_size=DEFAULT_CACHE_SIZE,
+                             module_mode=DEFAULT_MODULE_MODE, depth=False):
+    """
+    Function to extract diffusion features from a set of commits. Each commit
+    is diffed against its own parent(s) according to the merge policy. Commits
+    flagged by the large commit guard are processed without keeping their
+    patches. Before that, the given subtrees of the initial commit are scanned.
+    With the "build" module mode, the modules are the Maven or Gradle modules
+    owning the changed files instead of the top level directories. If depth is
+    set, the max and mean directory depth of the changed files are added.
+    """
+    repo = Repository(repo_path)
 
-    start = start - 1 if (start > 0) else start
-    commits = commits[start:stop] if (stop != -1) else commits[start:]
+    if initial_trees:
+        line_cache = LineCountCache(repo, cache_size, cache_path)
+        INITIAL[pid] = scan_trees(repo, initial_trees, line_cache,
+                                  initial_depth)
+        line_cache.close()
 
-    features = [[] for c in range(len(commits))]
-    for i, commit in enumerate(tqdm(commits[1:], position=pid)):
-        diff = repo.diff(commits[i], commit)
+    features = []
+    file_changes = array('q')
+    offsets = array('q')
+    trie = PathTrie()
+    module_index = BuildModuleIndex(repo) if module_mode == "build" else None
+    for commit_hex in tqdm(commits, position=pid):
+        commit = repo.get(commit_hex)
+
+        parent_diff = get_parent_diff(repo, commit, merge_policy)
+        if parent_diff is None:
+            continue
+        parent, diff = parent_diff
 
-        patches = [p for p in diff]
+        if module_index is not None:
+            module_index.update(commit, parent, diff)
 
-        # Extract all different subsystems that have been modified
-        modules = set([])
-        subsystems_mapping = {}
-        entropy_change = 0
+        large = False
+        patches = None
+        if guard is not None and guard.enabled:
+            large, patches = guard.check(diff)
 
-        file_changes = []
-        total_change = 0
-        for patch in patches:
+        if large:
+            changes = get_large_file_changes(repo, commit, diff, merge_policy,
+                                             guard)
+        else:
             # Skip binary files
-            if patch.delta.is_binary:
-                continue
-            _, addition, deletions = patch.line_stats
-            total_change = total_change + (addition + deletions)
-            file_changes.append(addition + deletions)
-
-            # Store all subsystems
-            fpath = patch.delta.new_file.path
-            subsystems = fpath.split('/')[:-1]
-
-            root = subsystems_mapping
-            for system in subsystems:
-                if system not in root:
-                    root[system] = {}
-                root = root[system]
-            if subsystems > 0:
-                modules.add(subsystems[0])
-
-        # Check how many subsystems that have been touched
-        modified_systems = count_diffing_subsystems(subsystems_mapping)
-
-        # Calculate the entropy for the commit
-        entropy_change = count_entropy(file_changes, total_change)
-
-        # Add all features
-        features[i].append(str(commit.hex))
-        features[i].append(str(float(modified_systems)))
-        features[i].append(str(float(len(modules))))
-        features[i].append(str(float(entropy_change)))
+            changes = [(p.delta.new_file.path,
+                        p.line_stats[1] + p.line_stats[2])
+                       for p in get_patches(repo, commit, diff, merge_policy,
+                                            patches)
+                       if not p.delta.is_binary]
+
+        offsets.append(len(file_changes))
+        paths = []
+        for fpath, change in changes:
+            file_changes.append(change)
+            paths.append(fpath)
+
+        # Check how many subsystems and modules that have been touched
+        modified_systems, modules = trie.count_touched(paths)
+        if module_index is not None:
+            modules = len(set([module_index.get_module(p) for p in paths]))
+
+        # Add all features, the entropy is filled in for the whole batch below
+        feature = []
+        feature.append(str(commit.hex))
+        feature.append(str(float(modified_systems)))
+        feature.append(str(float(modules)))
+        feature.append(None)
+        if guard is not None and guard.enabled:
+            feature.append("1" if large else "0")
+        if depth:
+            feature.extend(
+                get_depth_features([trie.get_depth(p) for p in paths]))
+        features.append(feature)
+
+    # Calculate the entropy of all commits at once
+    entropies = batch_entropy(file_changes, offsets)
+    for feature, entropy_change in zip(features, entropies):
+        feature[3] = str(float(entropy_change))
 
     RES[pid] = features
 
-def parse_tree(tree, repo):
+def split_initial_tree(repo, tree, parts):
     """
-    Parse a git tree and get the number of files, the number of systems and
-    the number of subdirectories.
+    Split the tree of the initial commit into subtrees that can be scanned in
+    parallel. The top level directories are the modules, and the tree is
+    expanded one level at a time until there are enough subtrees for the given
+    number of processes. Returns the files found while expanding together with
+    their directory depth, the subtrees, the depth of the files directly in the
+    subtrees, the number of modules and the number of subdirectories found while
+    expanding.
     """
-    found_sub_entries = 0
-    additions = 0
-    file_additions = []
-    tree = repo[tree.id]
-
+    blobs = []
+    subtrees = []
     for entry in tree:
-        if entry.type == "bin":
-            continue
-        if entry.type == "tree":
-            sub_additions, sub_file_additions, sub_entries = parse_tree(
-                entry, repo)
-            found_sub_entries += (1 + sub_entries)
-            additions += sub_additions
-            file_additions.extend(sub_file_additions)
-        else:
-            try:
-                sub_addition = len(str(repo[entry.id]).split('\n'))
-                additions += sub_addition
-                file_additions.append(sub_addition)
-            except Exception as ex:
-                print(ex)
-                continue
-
-    return additions, file_additions, found_sub_entries
-
-def get_diffusion_features(repo_path, branch):
+        if entry.type_str == "tree":
+            subtrees.append(str(entry.id))
+        elif entry.type_str == "blob":
+            blobs.append((entry.id, 0))
+    modules = len(subtrees)
+
+    subdirectories = 0
+    depth = 1
+    while subtrees and len(subtrees) < parts * SUBTREES_PER_PROCESS:
+        expanded = []
+        for tree_id in subtrees:
+            for entry in repo[tree_id]:
+                if entry.type_str == "tree":
+                    expanded.append(str(entry.id))
+                elif entry.type_str == "blob":
+                    blobs.append((entry.id, depth))
+        subdirectories += len(expanded)
+        subtrees = expanded
+        depth += 1
+
+    return blobs, subtrees, depth, modules, subdirectories
+
+def scan_trees(repo, tree_ids, line_cache, depth=0):
+    """
+    Get the number of lines and the directory depth of every text file and the
+    number of subdirectories below a set of trees, whose files are at the given
+    depth. The trees are walked iteratively, the lines are counted on the raw
+    blob data and binary files are skipped.
+    """
+    file_lines = []
+    file_depths = []
+    subdirectories = 0
+
+    stack = [(tree_id, depth) for tree_id in tree_ids]
+    while stack:
+        tree_id, tree_depth = stack.pop()
+        for entry in repo[tree_id]:
+            if entry.type_str == "tree":
+                subdirectories += 1
+                stack.append((str(entry.id), tree_depth + 1))
+            elif entry.type_str == "blob":
+                lines = line_cache.get_text(entry.id)
+                if lines is not None:
+                    file_lines.append(lines)
+                    file_depths.append(tree_depth)
+
+    return file_lines, subdirectories, file_depths
+
+def get_diffusion_features(repo_path, branch, cache_path=None,
+                           cache_size=DEFAULT_CACHE_SIZE,
+                           merge_policy=DEFAULT_MERGE_POLICY, guard=None,
+                           module_mode=DEFAULT_MODULE_MODE, half_life=None,
+                           depth=False):
     """
     Function that extracts the first commits diffusion features. It then starts
     a number of processes(equal to the number of cores on the computer), and then
-    distributes the remaining commits to them.
+    distributes the remaining commits to them. The tree of the first commit is
+    split into subtrees that the processes scan before their commits, while the
+    files at the top of the tree are counted here. If a half life is given, the
+    history complexity of each commit is computed here as well. If depth is
+    set, the max and mean directory depth of the changed files are added, and
+    of all text files for the first commit.
     """
     repo = Repository(repo_path)
 
@@ -146,54 +274,52 @@ def get_diffusion_features(repo_path, branch):
     commits = list(
         repo.walk(head.target, GIT_SORT_TOPOLOGICAL | GIT_SORT_REVERSE))
     initial = commits[0]
-    init_tree = initial.tree
-
-    # Count inital total lines of code
-    init_total_additions = 0
-    init_file_addtions = []
-
-    init_subdirectories = 0
-    init_modules = 0
-
-    for entry in init_tree:
-        if entry.type == "tree":
-            added, file_additions, subdirectories = parse_tree(entry, repo)
-
-            init_modules += 1
-            init_file_addtions.extend(file_additions)
-            init_total_additions += added
-            init_subdirectories += subdirectories
-        else:
-            try:
-                additions = len(str(repo[entry.id]).split('\n'))
-                init_total_additions += additions
-                init_file_addtions.append(additions)
-            except:
-                continue
-    diffusion_features = []
-    diffusion_features.append(initial.hex)
-    diffusion_features.append(init_subdirectories)
-    diffusion_features.append(init_modules)
-    diffusion_features.append(
-        count_entropy(init_file_addtions, init_total_additions))
 
     # Check how many processes that could be spawned
     cpus = cpu_count()
     print("Using {} cpus...".format(cpus))
-    # Divide the commits eqaully between the processes.
-    quote, remainder = divmod(len(commits), cpus)
+
+    init_blobs, init_trees, init_depth, init_modules, init_subdirectories = \
+        split_initial_tree(repo, initial.tree, cpus)
+    if module_mode == "build":
+        module_index = BuildModuleIndex(repo)
+        module_index.reset(initial.tree)
+        init_modules = len(module_index.modules)
+
+    # Distribute the commits between the processes.
+    commit_hexes = [str(c.hex) for c in commits]
+    shards = shard_commits(commit_hexes[1:], cpus)
 
     processes = [
         Process(
             target=parse_diffusion_features,
-            args=(i, repo_path, branch, i * quote + min(i, remainder),
-                  (i + 1) * quote + min(i + 1, remainder))) for i in range(cpus)
+            args=(i, repo_path, shards[i], merge_policy, guard,
+                  init_trees[i::cpus], init_depth, cache_path, cache_size,
+                  module_mode, depth))
+        for i in range(cpus)
     ]
 
     for process in processes:
         process.start()
 
     start_time = time.time()
+
+    # Count the files at the top of the initial tree while the processes run
+    line_cache = LineCountCache(repo, cache_size, cache_path)
+    init_file_lines = []
+    init_file_depths = []
+    for blob_id, blob_depth in init_blobs:
+        lines = line_cache.get_text(blob_id)
+        if lines is not None:
+            init_file_lines.append(lines)
+            init_file_depths.append(blob_depth)
+    line_cache.close()
+
+    complexities = None
+    if half_life is not None:
+        complexities = get_history_complexity(repo_path, branch, half_life,
+                                              merge_policy == "skip")
+
     for process in processes:
         process.join()
     end_time = time.time()
@@ -201,28 +327,61 @@ def get_diffusion_features(repo_path, branch):
     print("Done")
     print("Overall processing time {}".format(end_time - start_time))
 
+    for file_lines, subdirectories, file_depths in INITIAL.values():
+        init_file_lines.extend(file_lines)
+        init_subdirectories += subdirectories
+        init_file_depths.extend(file_depths)
+
+    diffusion_features = []
+    diffusion_features.append(initial.hex)
+    diffusion_features.append(init_subdirectories)
+    diffusion_features.append(init_modules)
+    diffusion_features.append(batch_entropy(init_file_lines, [0])[0])
+    if guard is not None and guard.enabled:
+        diffusion_features.append("0")
+    if depth:
+        diffusion_features.extend(get_depth_features(init_file_depths))
+
     # Assemble the results
-    features = []
+    rows = {}
     for _, feat in RES.items():
-        features.extend(feat)
-    features = list(reversed(features))
+        for row in feat:
+            rows[row[0]] = row
+
+    features = [rows[c] for c in reversed(commit_hexes[1:]) if c in rows]
     features.append(diffusion_features)
+
+    if complexities is not None:
+        for row in features:
+            row.insert(4, str(float(complexities.get(row[0], 0))))
     return features
 
 def save_diffusion_features(diffusion_features,
-                            path="./results/diffusion_features.csv"):
+                            path="./results/diffusion_features.csv",
+                            large_commits=False, history_complexity=False,
+                            depth=False):
     """
-    Save the diffusion features to a csv file.
+    Save the diffusion features to a csv file. If history_complexity is set, a
+    column holds the history complexity, if large_commits is set, a column
+    flags the commits that were processed as large commits, and if depth is
+    set, two columns hold the max and mean directory depth.
     """
+    header = [
+        "commit", "modified_subsystems", "modified_subdirectories", "entropy"
+    ]
+    if history_complexity:
+        header.append("history_complexity")
+    if large_commits:
+        header.append("large_commit")
+    if depth:
+        header.extend(["max_depth", "mean_depth"])
+
     with open(path, 'w') as csv_file:
         writer = csv.writer(csv_file)
-        writer.writerow([
-            "commit", "modified_subsystems", "modified_subdirectories",
-            "entropy"
-        ])
+        writer.writerow(header)
         for row in diffusion_features:
             if row:
-                writer.writerow([row[0], row[1], row[2], row[3]])
+                writer.writerow(row[:len(header)])
 
 
 if __name__ == "__main__":
@@ -242,6 +401,50 @@ if __name__ == "__main__":
         type=str,
         default="refs/heads/master",
         help="Which branch to use.")
+    PARSER.add_argument(
+        "--line-cache",
+        "-lc",
+        type=str,
+        default=None,
+        help="Path to an on-disk line count cache shared with the churn " +
+        "extraction.")
+    PARSER.add_argument(
+        "--line-cache-size",
+        type=int,
+        default=DEFAULT_CACHE_SIZE,
+        help="Number of line counts to keep in memory.")
+    PARSER.add_argument(
+        "--merge-policy",
+        "-mp",
+        type=str,
+        choices=MERGE_POLICIES,
+        default=DEFAULT_MERGE_POLICY,
+        help="How merges are diffed: against the first parent, skipped or " +
+        "combined so that only files differing from every parent count.")
+    PARSER.add_argument(
+        "--modules",
+        type=str,
+        choices=MODULE_MODES,
+        default=DEFAULT_MODULE_MODE,
+        help="What a module is: a top level directory or the nearest " +
+        "directory with a pom.xml or build.gradle.")
+    PARSER.add_argument(
+        "--history-complexity",
+        "-hc",
+        action="store_true",
+        help="Also compute the time-decayed history complexity of the " +
+        "changed files.")
+    PARSER.add_argument(
+        "--half-life",
+        type=parse_days,
+        default=DEFAULT_HALF_LIFE,
+        help="Half life in days of the history complexity.")
+    PARSER.add_argument(
+        "--depth",
+        action="store_true",
+        help="Also compute the max and mean directory depth of the changed " +
+        "files.")
+    add_guard_arguments(PARSER)
 
     ARGS = PARSER.parse_args()
     REPOPATH = ARGS.repository
@@ -250,5 +453,19 @@ if __name__ == "__main__":
         print("The repository path does not exist!")
         sys.exit(1)
 
-    DIFFUSION_FEATURES = get_diffusion_features(REPOPATH, BRANCH)
-    save_diffusion_features(DIFFUSION_FEATURES)
+    GUARD = get_guard(ARGS)
+    HALF_LIFE = ARGS.half_life if ARGS.history_complexity else None
+    if HALF_LIFE is not None and ARGS.merge_policy == "combine":
+        PARSER.error("--history-complexity does not support --merge-policy " +
+                     "combine")
+    DIFFUSION_FEATURES = get_diffusion_features(REPOPATH, BRANCH,
+                                                ARGS.line_cache,
+                                                ARGS.line_cache_size,
+                                                ARGS.merge_policy, GUARD,
+                                                ARGS.modules, HALF_LIFE,
+                                                ARGS.depth)
+    save_diffusion_features(
+        DIFFUSION_FEATURES,
+        large_commits=GUARD.enabled,
+        history_complexity=ARGS.history_complexity,
+        depth=ARGS.depth)
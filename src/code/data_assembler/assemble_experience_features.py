@@ -19,6 +19,14 @@ from numpy import floor
 import git
 from tqdm import tqdm
 
+from author_experience import (RecentExperience, SubsystemExperience,
+                               get_rrexp)
+from git_log_stream import (get_first_commit_time, read_name_only_log,
+                            read_tree_paths)
+from time_windows import SECONDS_PER_DAY
+
+BACKENDS = ["gitpython", "git-log"]
+
 def set_to_list(obj):
     """
     Helper function to turn sets to lists and floats to strings.
@@ -49,11 +57,16 @@ def get_files_in_tree(tree):
     return files
 
 
-def get_diffing_files(commit, parent):
+def get_diffing_files(commit):
     """
-    Function to get the files that differs between two commits.
+    Function to get the files that a commit changed compared to its first
+    parent, like the git log backend. A root commit is compared to the empty
+    tree, and renames are listed as a deleted and an added file.
     """
-    diff = parent.diff(commit)
+    if commit.parents:
+        diff = commit.parents[0].diff(commit, no_renames=True)
+    else:
+        diff = commit.diff(git.NULL_TREE, no_renames=True)
 
     patches = [p for p in diff]
     files = set()
@@ -67,6 +80,61 @@ def get_diffing_files(commit, parent):
 
     return files
 
+def get_diffing_years(seconds):
+    """
+    Get the number of whole years, counted from whole days, between a commit
+    and the first commit of the repository.
+    """
+    days = floor(seconds / SECONDS_PER_DAY)
+    return abs(floor(float(days) / 365))
+
+
+def update_experience_graph(all_authors, recent_experience,
+                            subsystem_experience, author, commit_hex, paths,
+                            diffing_years):
+    """
+    Add a commit by an author that changed some files to the experience graph.
+    The earlier changes of an author that has been seen before are aged by the
+    number of years between the commit and the first commit. The change is
+    recorded in the subsystem experience, which is added to the node by
+    add_subsystem_experience once the walk is done. Only the recent experience
+    of the commit is stored in the node, while the histogram it is computed
+    from is only kept in memory, once per author. Returns the node of the
+    commit.
+    """
+    files = set(paths)
+    subsystem_experience.add(author, files)
+
+    node = {}
+    if author not in all_authors:
+        all_authors[author] = {}
+        recent_experience[author] = RecentExperience()
+        recent_experience[author].add(len(files), 0)
+        node['prevcommit'] = ""
+        node["exp"] = 1
+    else:
+        last_commit = all_authors[author]["lastcommit"]
+        recent_experience[author].add(len(files), float(diffing_years))
+        node['prevcommit'] = last_commit
+        node['exp'] = 1 + all_authors[author][last_commit]['exp']
+    node["rrexp"] = recent_experience[author].get_rrexp()
+
+    all_authors[author]['lastcommit'] = commit_hex
+    all_authors[author][commit_hex] = node
+    return node
+
+
+def add_subsystem_experience(nodes, subsystem_experience):
+    """
+    Add the subsystem experience to the nodes of a walk, given in walk order.
+    It is the number of older changes of the author to the subsystems that the
+    commit touches, so it can only be counted once the walk has reached the
+    oldest commit.
+    """
+    for node, sexp in zip(nodes, subsystem_experience.get_counts()):
+        node["sexp"] = sexp
+
+
 def save_experience_features_graph(repo_path, branch, graph_path):
     """
     Function to get and save the experience graph.
@@ -91,47 +159,33 @@ def save_experience_features_graph(repo_path, branch, graph_path):
     files = get_files_in_tree(current_commit.tree)
 
     all_authors = {}
+    recent_experience = {}
+    subsystem_experience = SubsystemExperience()
 
-    author = current_commit.committer.name
-
-    all_authors[author] = {}
-    all_authors[author]['lastcommit'] = current_commit.hexsha
-    all_authors[author][current_commit.hexsha] = {}
-    all_authors[author][current_commit.hexsha]['prevcommit'] = ""
-    all_authors[author][current_commit.hexsha]["exp"] = 1
-    all_authors[author][current_commit.hexsha]["rexp"] = [[len(files), 1]]
-    all_authors[author][current_commit.hexsha]["sexp"] = {}
+    nodes = [
+        update_experience_graph(all_authors, recent_experience,
+                                subsystem_experience,
+                                current_commit.committer.name,
+                                current_commit.hexsha,
+                                [name for (_, name) in files], 0)
+    ]
 
-    for i, commit in enumerate(tqdm(commits[1:])):
-        files = get_diffing_files(commit, commits[i])
-
-        author = commit.committer.name
-        if author not in all_authors:
-            all_authors[author] = {}
-            all_authors[author]['lastcommit'] = commit.hexsha
-            all_authors[author][commit.hexsha] = {}
-            all_authors[author][commit.hexsha]['prevcommit'] = ""
-            all_authors[author][commit.hexsha]["exp"] = 1
-            all_authors[author][commit.hexsha]["rexp"] = [[len(files), 1.0]]
-            all_authors[author][commit.hexsha]["sexp"] = {}
-        else:
-            last_commit = all_authors[author]["lastcommit"]
-            all_authors[author]["lastcommit"] = commit.hexsha
-            all_authors[author][commit.hexsha] = {}
-            all_authors[author][commit.hexsha]['prevcommit'] = last_commit
-            all_authors[author][commit.hexsha][
-                'exp'] = 1 + all_authors[author][last_commit]['exp']
+    for commit in tqdm(commits[1:]):
+        files = get_diffing_files(commit)
 
-            date_current = commit.committed_datetime
-            date_last = commits[-1].committed_datetime#repo.get(last_commit).commit_time)
+        date_current = commit.committed_datetime
+        date_last = commits[-1].committed_datetime#repo.get(last_commit).commit_time)
 
-            diffing_years = abs(floor(float((date_current - date_last).days) / 365))
+        diffing_years = get_diffing_years(
+            (date_current - date_last).total_seconds())
 
-            overall = all_authors[author][last_commit]['rexp']
+        nodes.append(
+            update_experience_graph(all_authors, recent_experience,
+                                    subsystem_experience,
+                                    commit.committer.name, commit.hexsha,
+                                    files, diffing_years))
 
-            all_authors[author][commit.hexsha][
-                'rexp'] = [[len(files), 1.0]] + [[e[0], e[1] + diffing_years]
-                                                 for e in overall]
+    add_subsystem_experience(nodes, subsystem_experience)
 
     with open(graph_path, 'w') as output:
         json.dump(all_authors, output, default=set_to_list)
@@ -183,21 +237,89 @@ def get_experience_features(graph, repo_path, branch):
         author = commit.committer.name
 
         exp = graph[author][commit.hexsha]['exp']
-        rexp = graph[author][commit.hexsha]['rexp']
-        try:
-            rrexp = sum([float(float(e[0]) / (float(e[1]) + 1)) for e in rexp])
-        except:
-            print(author)
-            print(commit.hexsha)
-            print(rexp)
-            sys.exit(1)
+        rrexp = graph[author][commit.hexsha].get('rrexp')
+        # Graphs saved before sexp was computed have no count here
+        sexp = graph[author][commit.hexsha].get('sexp') or 0
+        if rrexp is None:
+            # Graphs saved before rrexp was stored keep the whole histogram
+            rexp = graph[author][commit.hexsha]['rexp']
+            try:
+                rrexp = get_rrexp(rexp)
+            except:
+                print(author)
+                print(commit.hexsha)
+                print(rexp)
+                sys.exit(1)
 
         commit_feat = []
         commit_feat.append(str(commit.hexsha))
         commit_feat.append(str(float(exp)))
         commit_feat.append(str(float(rrexp)))
-        commit_feat.append(str(float(0)))
+        commit_feat.append(str(float(sexp)))
+        features.append(commit_feat)
+    return features
+
+
+def get_experience_features_from_log(repo_path, branch, graph_path=None):
+    """
+    Build the experience graph and extract the experience features in a single
+    pass over a streaming git log --name-only, in the same order as the
+    GitPython backend. The files of each commit are the files it changed
+    compared to its first parent. The first commit is seeded with all the
+    files of its tree. The subsystem experience of the rows is filled in after
+    the walk. The graph is only saved if a path is given.
+    """
+    start_time = time.time()
+
+    first_time = get_first_commit_time(repo_path, branch)
+
+    all_authors = {}
+    recent_experience = {}
+    subsystem_experience = SubsystemExperience()
+    nodes = []
+    features = []
+    for i, log_commit in enumerate(
+            tqdm(read_name_only_log(repo_path, branch))):
+        if i == 0:
+            files = list(read_tree_paths(repo_path, log_commit.hex))
+            nodes.append(
+                update_experience_graph(all_authors, recent_experience,
+                                        subsystem_experience,
+                                        log_commit.author, log_commit.hex,
+                                        files, 0))
+            features.append([
+                str(log_commit.hex),
+                str(1.0),
+                str(len(files)),
+                str(0.0)
+            ])
+            continue
+
+        diffing_years = get_diffing_years(log_commit.time - first_time)
+        node = update_experience_graph(all_authors, recent_experience,
+                                       subsystem_experience, log_commit.author,
+                                       log_commit.hex, log_commit.changes,
+                                       diffing_years)
+        nodes.append(node)
+
+        commit_feat = []
+        commit_feat.append(str(log_commit.hex))
+        commit_feat.append(str(float(node['exp'])))
+        commit_feat.append(str(float(node['rrexp'])))
         features.append(commit_feat)
+
+    add_subsystem_experience(nodes, subsystem_experience)
+    for node, commit_feat in zip(nodes[1:], features[1:]):
+        commit_feat.append(str(float(node['sexp'])))
+
+    if graph_path:
+        with open(graph_path, 'w') as output:
+            json.dump(all_authors, output, default=set_to_list)
+
+    end_time = time.time()
+
+    print("Done")
+    print("Overall processing time {}".format(end_time - start_time))
     return features
 
 
@@ -240,6 +362,14 @@ if __name__ == "__main__":
         type=str,
         default="./results/author_graph.json",
         help="The path to where the graph is stored.")
+    PARSER.add_argument(
+        "--backend",
+        type=str,
+        choices=BACKENDS,
+        default="gitpython",
+        help="Diff every commit with GitPython and read the graph back, or " +
+        "build the graph and extract the features in a single pass over a " +
+        "streaming git log --name-only.")
     PARSER.add_argument(
         "--output",
         "-o",
@@ -254,8 +384,13 @@ if __name__ == "__main__":
     GRAPH_PATH = ARGS.graph_path
     OUTPUT = ARGS.output
 
-    if SAVE_GRAPH:
-        save_experience_features_graph(REPO_PATH, BRANCH, GRAPH_PATH)
-    GRAPH = load_experience_features_graph(GRAPH_PATH)
-    EXPERIENCE_FEATURES = get_experience_features(GRAPH, REPO_PATH, BRANCH)
+    if ARGS.backend == "git-log":
+        EXPERIENCE_FEATURES = get_experience_features_from_log(
+            REPO_PATH, BRANCH, GRAPH_PATH if SAVE_GRAPH else None)
+    else:
+        if SAVE_GRAPH:
+            save_experience_features_graph(REPO_PATH, BRANCH, GRAPH_PATH)
+        GRAPH = load_experience_features_graph(GRAPH_PATH)
+        EXPERIENCE_FEATURES = get_experience_features(GRAPH, REPO_PATH,
+                                                      BRANCH)
     save_experience_features(EXPERIENCE_FEATURES, OUTPUT)
@@ -6,109 +6,123 @@ __copyright__ = "Copyright (c) 2018 Axis Communications AB"
 __license__ = "MIT"
 
 import csv
-import json
 import time
 
 from argparse import ArgumentParser
-from pygit2 import Repository, GIT_SORT_TOPOLOGICAL, GIT_SORT_REVERSE
+from pygit2 import (Repository, GIT_DELTA_DELETED, GIT_SORT_TOPOLOGICAL,
+                    GIT_SORT_REVERSE)
 from tqdm import tqdm
 
-def set_to_list(obj):
+from commit_diffs import get_parent_diff
+from commit_index import CommitTimeIndex
+from file_history_graph import FileHistoryGraph, FileHistoryGraphBuilder
+from file_lineage import DEFAULT_SIMILARITY, DEFAULT_RENAME_LIMIT, FileLineage
+from file_ownership import FileOwnership, get_ownership_header
+from history_windows import WindowedFileHistory, get_window_header
+from line_count_cache import LineCountCache, DEFAULT_CACHE_SIZE
+from prior_defects import (PriorDefects, get_prior_defect_header,
+                           load_prior_defects)
+from time_windows import parse_windows
+
+def get_files_in_tree(tree, repo, line_cache):
     """
-    Helper function to convert a set to a list.
-    """
-    if isinstance(obj, set):
-        return list(obj)
-    raise TypeError
-
-def get_files_in_tree(tree, repo):
-    """
-    Extract the hex of all files and their name.
+    Extract the hex of all files and their name. Only java files are kept, and
+    the extension is checked before any blob is loaded. Whether a blob is
+    binary is looked up in a LineCountCache, which keeps it per blob id.
     """
     files = set()
-    for entry in tree:
-        if entry.type == "tree":
-            sub_files = [(f[0], "{}/{}".format(entry.name, f[1]))
-                         for f in get_files_in_tree(repo[entry.id], repo)]
-            files.update(sub_files)
-        else:
-            blob = repo[entry.id]
-            if not blob.is_binary:
-                if entry.name.endswith("java"):
-                    files.add((entry.hex, entry.name))
+    stack = [(tree, "")]
+    while stack:
+        tree, prefix = stack.pop()
+        for entry in tree:
+            if entry.type_str == "tree":
+                stack.append((repo[entry.id], prefix + entry.name + "/"))
+            elif entry.type_str == "blob" and entry.name.endswith("java"):
+                if line_cache.get_text(entry.id) is not None:
+                    files.add((entry.hex, prefix + entry.name))
     return files
 
 
-def get_diffing_files(commit, parent, repo):
+def get_diffing_files(commit, repo, lineage=None):
     """
-    Get the files that diffed between two commits.
+    Get the files that diffed between a commit and its first parent, or the
+    empty tree for a root commit. If a file lineage is given, renames are
+    detected and the files are named by their stable file ids instead of their
+    paths.
     """
-    diff = repo.diff(parent, commit)
+    _, diff = get_parent_diff(repo, commit)
+
+    file_ids = lineage.update(diff) if lineage is not None else None
 
     patches = [p for p in diff]
 
     files = set()
 
-    for patch in patches:
+    for i, patch in enumerate(patches):
         if patch.delta.is_binary:
             continue
         nfile = patch.delta.new_file
-        files.add((nfile.id, nfile.path, patch.delta.status))
+        name = nfile.path if file_ids is None else file_ids[i]
+        files.add((nfile.id, name, patch.delta.status))
 
     return files
 
 
-def save_history_features_graph(repo_path, branch, graph_path):
+def seed_history_graph(graph, commit, repo, line_cache, lineage=None):
+    """
+    Add all java files in the tree of a commit to the graph.
+    """
+    files = get_files_in_tree(commit.tree, repo, line_cache)
+
+    for (_, name) in tqdm(files):
+        if lineage is not None:
+            name = lineage.get_id(name)
+        graph.update(name, commit.hex, commit.committer.name)
+
+
+def update_history_graph(graph, commit, files):
+    """
+    Add the files changed by a commit to the graph. Deleted files are evicted
+    from memory. Returns the previous commit and the authors of each file.
+    """
+    file_histories = []
+    for (_, name, status) in files:
+        file_histories.append(
+            graph.update(name, commit.hex, commit.committer.name))
+        if status == GIT_DELTA_DELETED:
+            graph.evict(name)
+    return file_histories
+
+
+def save_history_features_graph(repo_path, branch, graph_path, lineage=None,
+                                graph=None, line_cache=None):
     """
     Track the number of developers that have worked in a repository and save the
-    results in a graph which could be used for later use.
+    results in a graph which could be used for later use. The graph is saved as
+    a directory of memory mappable arrays. If a file lineage is given, the files
+    are keyed by their stable file ids so that renames keep their history. A
+    builder can be given to bound the memory used for the state of the files,
+    and a line count cache to share the binary status of the blobs.
     """
     repo = Repository(repo_path)
     head = repo.references.get(branch)
 
     commits = list(
         repo.walk(head.target, GIT_SORT_TOPOLOGICAL | GIT_SORT_REVERSE))
-    current_commit = repo.head.target
 
     start_time = time.time()
 
-    all_files = {}
-    current_commit = repo.get(str(current_commit))
-    files = get_files_in_tree(current_commit.tree, repo)
-
-    for (_, name) in tqdm(files):
-        all_files[name] = {}
-        all_files[name]['lastcommit'] = current_commit.hex
-        all_files[name][current_commit.hex] = {}
-        all_files[name][current_commit.hex]["prevcommit"] = ""
-        all_files[name][current_commit.hex]["authors"] = [
-            current_commit.committer.name
-        ]
-
-    for i, commit in enumerate(tqdm(commits[1:])):
-        files = get_diffing_files(commit, commits[i], repo)
-        for (_, name, _) in files:
-            if name not in all_files:
-                all_files[name] = {}
-
-            last_commit = ""
-            if 'lastcommit' not in all_files[name]:
-                all_files[name]['lastcommit'] = commit.hex
-            else:
-                last_commit = all_files[name]['lastcommit']
-
-            all_files[name][commit.hex] = {}
-            all_files[name][commit.hex]["prevcommit"] = last_commit
+    if graph is None:
+        graph = FileHistoryGraphBuilder()
+    if line_cache is None:
+        line_cache = LineCountCache(repo)
+    seed_history_graph(graph, commits[0], repo, line_cache, lineage)
 
-            authors = set([commit.committer.name])
-            if last_commit:
-                authors.update(all_files[name][last_commit]["authors"])
-            all_files[name][commit.hex]["authors"] = authors
+    for commit in tqdm(commits[1:]):
+        files = get_diffing_files(commit, repo, lineage)
+        update_history_graph(graph, commit, files)
 
-            all_files[name]['lastcommit'] = commit.hex
-
-    with open(graph_path, 'w') as output:
-        json.dump(all_files, output, default=set_to_list)
+    graph.save(graph_path)
 
     end_time = time.time()
 
@@ -117,19 +131,67 @@ def save_history_features_graph(repo_path, branch, graph_path):
 
 def load_history_features_graph(path):
     """
-    Save the history features to a csv file.
+    Load a graph saved by save_history_features_graph. The graph is memory
+    mapped and not read into memory.
+    """
+    return FileHistoryGraph(path)
+
+
+def get_initial_history_features(commit, windows=None):
+    """
+    Get the history features of the first commit.
     """
-    file_graph = {}
-    with open(path, 'r') as inp:
-        file_graph = json.load(inp)
-    return file_graph
+    commit_feat = []
+    commit_feat.append(str(commit.hex))
+    commit_feat.append(str(1.0))
+    commit_feat.append(str(0.0))
+    commit_feat.append(str(0.0))
+    for _ in windows or []:
+        commit_feat.extend([str(1.0), str(0.0), str(0.0)])
+    return commit_feat
 
 
-def get_history_features(graph, repo_path, branch):
+def get_commit_history_features(commit, file_histories, time_index):
+    """
+    Get the history features of a commit given the previous commit and the
+    authors of each of its files. The times of the previous commits are
+    gathered from the commit time index.
+    """
+    total_number_of_authors = set()
+    prev_commits = []
+
+    for prev_commit, authors in file_histories:
+        total_number_of_authors.update(authors)
+
+        if prev_commit:
+            prev_commits.append(prev_commit)
+
+    total_unique_changes = set(prev_commits)
+
+    total_age = 0
+    if prev_commits:
+        ages = commit.commit_time - time_index.get_times(prev_commits)
+        total_age = float(ages.sum()) / len(ages)
+
+    commit_feat = []
+    commit_feat.append(str(commit.hex))
+    commit_feat.append(str(float(len(total_number_of_authors))))
+    commit_feat.append(str(float(total_age)))
+    commit_feat.append(str(float(len(total_unique_changes))))
+    return commit_feat
+
+
+def get_history_features(graph, repo_path, branch, windows=None,
+                         lineage=None, prior_defects=None, ownership=None,
+                         line_cache=None):
     """
     Function that extracts the history features from a git repository.
     They are the total number of authors, the total age and the total
-    number of unique changes.
+    number of unique changes, optionally followed by the same features over
+    a number of sliding windows of days, by the prior defect features and by
+    the ownership features. The file lineage must be configured like the one
+    that the graph was built with, and the files of the root tree are found
+    with the line count cache if one is given.
     """
     repo = Repository(repo_path)
     head = repo.references.get(branch)
@@ -137,57 +199,139 @@ def get_history_features(graph, repo_path, branch):
     commits = list(
         repo.walk(head.target, GIT_SORT_TOPOLOGICAL | GIT_SORT_REVERSE))
 
-    features = []
+    time_index = CommitTimeIndex(commits)
+    windowed = WindowedFileHistory(windows) if windows else None
 
-    commit_feat = []
-    commit_feat.append(str(commits[0].hex))
-    commit_feat.append(str(1.0))
-    commit_feat.append(str(0.0))
-    commit_feat.append(str(0.0))
-    features.append(commit_feat)
+    # Replay the ids that the files of the root tree were seeded with
+    if lineage is not None:
+        if line_cache is None:
+            line_cache = LineCountCache(repo)
+        for (_, name) in get_files_in_tree(commits[0].tree, repo, line_cache):
+            lineage.get_id(name)
 
-    for i, commit in enumerate(tqdm(commits[1:])):
-        files = get_diffing_files(commit, commits[i], repo)
+    features = []
+    features.append(get_initial_history_features(commits[0], windows))
+    if prior_defects is not None:
+        features[0].extend(PriorDefects.get_initial_features())
+    if ownership is not None:
+        features[0].extend(FileOwnership.get_initial_features())
 
-        total_number_of_authors = set()
-        total_age = []
-        total_unique_changes = set()
+    for commit in tqdm(commits[1:]):
+        files = get_diffing_files(commit, repo, lineage)
 
+        file_histories = []
         for (_, name, _) in files:
-            sub_graph = graph[name][commit.hex]
-            total_number_of_authors.update(sub_graph['authors'])
+            sub_graph = graph.get(name, commit.hex)
+            if sub_graph is not None:
+                file_histories.append(sub_graph)
+
+        commit_feat = get_commit_history_features(commit, file_histories,
+                                                  time_index)
+        if windowed is not None:
+            commit_feat.extend(get_windowed_features(windowed, commit, files))
+        if prior_defects is not None:
+            commit_feat.extend(
+                prior_defects.update(commit.hex,
+                                     [name for (_, name, _) in files]))
+        if ownership is not None:
+            commit_feat.extend(
+                get_ownership_features(ownership, commit, files))
+        features.append(commit_feat)
+    return features
 
-            prev_commit = sub_graph['prevcommit']
-            if prev_commit:
-                total_unique_changes.add(prev_commit)
 
-                prev_commit_obj = repo.get(prev_commit)
+def get_windowed_features(windowed, commit, files):
+    """
+    Update the sliding windows with the files of a commit and get its windowed
+    history features.
+    """
+    return windowed.update(commit.hex, commit.commit_time,
+                           commit.committer.name,
+                           [name for (_, name, _) in files])
 
-                total_age.append(commit.commit_time -
-                                 prev_commit_obj.commit_time)
 
-        total_age = float(sum(total_age)) / len(total_age) if total_age else 0
+def get_ownership_features(ownership, commit, files):
+    """
+    Update the owners of the files of a commit and get its ownership features.
+    """
+    return ownership.update(
+        commit.committer.name, [name for (_, name, _) in files],
+        [name for (_, name, status) in files if status == GIT_DELTA_DELETED])
+
 
-        commit_feat = []
-        commit_feat.append(str(commit.hex))
-        commit_feat.append(str(float(len(total_number_of_authors))))
-        commit_feat.append(str(float(total_age)))
-        commit_feat.append(str(float(len(total_unique_changes))))
+def get_history_features_fused(repo_path, branch, graph_path=None,
+                               windows=None, lineage=None, graph=None,
+                               prior_defects=None, ownership=None,
+                               line_cache=None):
+    """
+    Build the file history graph and extract the history features in a single
+    pass. The features of each commit are taken from the graph as soon as it
+    has been updated with the commit, so every commit is only diffed once. The
+    graph is only saved if a path is given.
+    """
+    repo = Repository(repo_path)
+    head = repo.references.get(branch)
+
+    commits = list(
+        repo.walk(head.target, GIT_SORT_TOPOLOGICAL | GIT_SORT_REVERSE))
+
+    time_index = CommitTimeIndex(commits)
+    windowed = WindowedFileHistory(windows) if windows else None
+
+    if graph is None:
+        graph = FileHistoryGraphBuilder()
+    if line_cache is None:
+        line_cache = LineCountCache(repo)
+    seed_history_graph(graph, commits[0], repo, line_cache, lineage)
+
+    features = []
+    features.append(get_initial_history_features(commits[0], windows))
+    if prior_defects is not None:
+        features[0].extend(PriorDefects.get_initial_features())
+    if ownership is not None:
+        features[0].extend(FileOwnership.get_initial_features())
+
+    for commit in tqdm(commits[1:]):
+        files = get_diffing_files(commit, repo, lineage)
+
+        file_histories = update_history_graph(graph, commit, files)
+
+        commit_feat = get_commit_history_features(commit, file_histories,
+                                                  time_index)
+        if windowed is not None:
+            commit_feat.extend(get_windowed_features(windowed, commit, files))
+        if prior_defects is not None:
+            commit_feat.extend(
+                prior_defects.update(commit.hex,
+                                     [name for (_, name, _) in files]))
+        if ownership is not None:
+            commit_feat.extend(
+                get_ownership_features(ownership, commit, files))
         features.append(commit_feat)
+
+    if graph_path:
+        graph.save(graph_path)
     return features
 
 
-def save_history_features(history_features, path):
+def save_history_features(history_features, path, windows=None,
+                          prior_defects=False, ownership=False):
     """
     Function to save the history features as a csv file.
     """
+    header = ["commit", "number_of_authors", "age", "number_unique_changes"]
+    header.extend(get_window_header(windows or []))
+    if prior_defects:
+        header.extend(get_prior_defect_header())
+    if ownership:
+        header.extend(get_ownership_header())
+
     with open(path, 'w') as csv_file:
         writer = csv.writer(csv_file)
-        writer.writerow(
-            ["commit", "number_of_authors", "age", "number_unique_changes"])
+        writer.writerow(header)
         for row in history_features:
             if row:
-                writer.writerow([row[0], row[1], row[2], row[3]])
+                writer.writerow(row[:len(header)])
 
 
 if __name__ == "__main__":
@@ -215,8 +359,81 @@ if __name__ == "__main__":
         "--graph-path",
         "-gp",
         type=str,
-        default="./results/file_graph.json",
-        help="The path to where the graph is stored.")
+        default="./results/file_graph",
+        help="The directory where the graph is stored.")
+    PARSER.add_argument(
+        "--fused",
+        "-f",
+        action="store_true",
+        help="Build the graph and extract the features in a single pass. " +
+        "The graph is then only saved if --save-graph is given.")
+    PARSER.add_argument(
+        "--windows",
+        "-w",
+        type=parse_windows,
+        default=None,
+        help="Comma separated sizes in days of sliding windows to also " +
+        "compute the history features over, e.g. 30,90,365.")
+    PARSER.add_argument(
+        "--renames",
+        action="store_true",
+        help="Follow files through renames. The graph must be built and " +
+        "read with the same rename options.")
+    PARSER.add_argument(
+        "--rename-similarity",
+        type=int,
+        default=DEFAULT_SIMILARITY,
+        help="Similarity in percent for a file to count as renamed.")
+    PARSER.add_argument(
+        "--rename-limit",
+        type=int,
+        default=DEFAULT_RENAME_LIMIT,
+        help="Maximum number of files to compare in the rename detection " +
+        "of a commit.")
+    PARSER.add_argument(
+        "--line-cache",
+        "-lc",
+        type=str,
+        default=None,
+        help="Path to an on-disk line count cache, shared with the churn " +
+        "and diffusion extraction, that keeps whether each blob is binary.")
+    PARSER.add_argument(
+        "--line-cache-size",
+        type=int,
+        default=DEFAULT_CACHE_SIZE,
+        help="Number of blobs to keep in memory in the line count cache.")
+    PARSER.add_argument(
+        "--max-active-files",
+        type=int,
+        default=None,
+        help="Number of recently changed files to keep the graph state of " +
+        "in memory. Needs --spill-path.")
+    PARSER.add_argument(
+        "--spill-path",
+        type=str,
+        default=None,
+        help="Directory where the graph is spilled in blocks while it is " +
+        "built, together with the state of evicted and deleted files.")
+    PARSER.add_argument(
+        "--labels",
+        "-l",
+        type=str,
+        default=None,
+        help="A labels file made by assemble_labels.py. Together with " +
+        "--pairs, adds the counts of prior fixes and introducers of the " +
+        "changed files.")
+    PARSER.add_argument(
+        "--pairs",
+        "-p",
+        type=str,
+        default="../szz/results/fix_and_introducers_pairs.json",
+        help="The file with the bug fix and bug introducing pairs.")
+    PARSER.add_argument(
+        "--ownership",
+        action="store_true",
+        help="Add the ownership features of the changed files: the share " +
+        "of the top author, the number of minor contributors and the " +
+        "author entropy.")
     PARSER.add_argument(
         "--output",
         "-o",
@@ -230,10 +447,39 @@ if __name__ == "__main__":
     SAVE_GRAPH = ARGS.save_graph
     GRAPH_PATH = ARGS.graph_path
     OUTPUT = ARGS.output
+    WINDOWS = ARGS.windows or None
     print(SAVE_GRAPH)
 
-    if SAVE_GRAPH:
-        save_history_features_graph(REPO_PATH, BRANCH, GRAPH_PATH)
-    GRAPH = load_history_features_graph(GRAPH_PATH)
-    HISTORY_FEATURES = get_history_features(GRAPH, REPO_PATH, BRANCH)
-    save_history_features(HISTORY_FEATURES, OUTPUT)
+    def make_lineage():
+        """
+        Create a new file lineage from the rename options, if enabled.
+        """
+        if not ARGS.renames:
+            return None
+        return FileLineage(ARGS.rename_similarity, ARGS.rename_limit)
+
+    if ARGS.max_active_files is not None and ARGS.spill_path is None:
+        PARSER.error("--max-active-files needs --spill-path")
+    BUILDER = FileHistoryGraphBuilder(ARGS.max_active_files, ARGS.spill_path)
+    PRIOR_DEFECTS = load_prior_defects(ARGS.labels, ARGS.pairs) \
+        if ARGS.labels else None
+    OWNERSHIP = FileOwnership() if ARGS.ownership else None
+    LINE_CACHE = LineCountCache(Repository(REPO_PATH), ARGS.line_cache_size,
+                                ARGS.line_cache)
+
+    if ARGS.fused:
+        HISTORY_FEATURES = get_history_features_fused(
+            REPO_PATH, BRANCH, GRAPH_PATH if SAVE_GRAPH else None, WINDOWS,
+            make_lineage(), BUILDER, PRIOR_DEFECTS, OWNERSHIP, LINE_CACHE)
+    else:
+        if SAVE_GRAPH:
+            save_history_features_graph(REPO_PATH, BRANCH, GRAPH_PATH,
+                                        make_lineage(), BUILDER, LINE_CACHE)
+        GRAPH = load_history_features_graph(GRAPH_PATH)
+        HISTORY_FEATURES = get_history_features(GRAPH, REPO_PATH, BRANCH,
+                                                WINDOWS, make_lineage(),
+                                                PRIOR_DEFECTS, OWNERSHIP,
+                                                LINE_CACHE)
+    LINE_CACHE.close()
+    save_history_features(HISTORY_FEATURES, OUTPUT, WINDOWS,
+                          PRIOR_DEFECTS is not None, OWNERSHIP is not None)
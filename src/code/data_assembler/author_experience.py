@@ -0,0 +1,121 @@
+"""
+Running experience state of the authors of a repository.
+"""
+__license__ = "MIT"
+
+
+class RecentExperience:
+    """
+    Histogram of the number of files an author has changed per age in years.
+    Every new change of the author ages all earlier changes by the same number
+    of years, so the buckets are stored by the total aging of the author when
+    they were created, and aging is a single addition. Buckets are ordered
+    from the oldest to the newest and changes with the same age share a
+    bucket, so the histogram has one bucket per distinct age and the ages are
+    kept exactly. The weight of a bucket depends on its exact age and the ages
+    are unbounded, so the buckets can't be bounded without approximating the
+    recent experience.
+    """
+
+    def __init__(self):
+        self.aging = 0.0
+        self.buckets = []
+
+    def add(self, files, years):
+        """
+        Age the earlier changes by a number of years and add a change of a
+        number of files with an age of one year.
+        """
+        self.aging += years
+        if self.buckets and self.buckets[-1][0] == self.aging:
+            self.buckets[-1][1] += files
+        else:
+            self.buckets.append([self.aging, files])
+
+    def get_histogram(self):
+        """
+        Get the histogram as a list of number of files and age pairs, from the
+        newest to the oldest.
+        """
+        return [[files, self._get_age(created)]
+                for created, files in reversed(self.buckets)]
+
+    def get_rrexp(self):
+        """
+        Get the recent experience of the histogram, see get_rrexp.
+        """
+        return sum(float(files) / (self._get_age(created) + 1)
+                   for created, files in self.buckets)
+
+    def _get_age(self, created):
+        return 1.0 + self.aging - created
+
+
+def get_rrexp(histogram):
+    """
+    Get the recent experience of a histogram made by RecentExperience, where
+    the files of every bucket are weighted by one over their age plus one.
+    """
+    return sum(float(files) / (float(age) + 1) for files, age in histogram)
+
+
+def get_subsystem(path):
+    """
+    Get the subsystem of a file, which is its top level directory, or "" for
+    files at the top level.
+    """
+    subsystem, separator, _ = path.partition('/')
+    return subsystem if separator else ""
+
+
+class SubsystemExperience:
+    """
+    Counts the changes every author has made to every subsystem before each
+    change. The walks go from the newest commit to the oldest, so the changes
+    are recorded in walk order with their subsystems interned to integer ids,
+    and counted afterwards from the oldest to the newest. Every author then
+    has a table of change counts per subsystem id, so a change only looks up
+    and updates the counters of the subsystems it touches.
+    """
+
+    def __init__(self):
+        self.subsystems = {}
+        self.changes = []
+
+    def add(self, author, paths):
+        """
+        Record a change by an author to some files, older than the changes
+        recorded before it.
+        """
+        subsystems = set()
+        for path in paths:
+            subsystem = get_subsystem(path)
+            subsystem_id = self.subsystems.get(subsystem)
+            if subsystem_id is None:
+                subsystem_id = len(self.subsystems)
+                self.subsystems[subsystem] = subsystem_id
+            subsystems.add(subsystem_id)
+        self.changes.append((author, tuple(subsystems)))
+
+    def get_counts(self):
+        """
+        Get, for every recorded change in the order they were recorded, the
+        number of older changes its author has made to its subsystems, summed
+        over the subsystems.
+        """
+        counts = {}
+        sexps = [0] * len(self.changes)
+        for index in range(len(self.changes) - 1, -1, -1):
+            author, subsystems = self.changes[index]
+            author_counts = counts.get(author)
+            if author_counts is None:
+                author_counts = {}
+                counts[author] = author_counts
+
+            sexp = 0
+            for subsystem_id in subsystems:
+                count = author_counts.get(subsystem_id, 0)
+                sexp += count
+                author_counts[subsystem_id] = count + 1
+            sexps[index] = sexp
+        return sexps
@@ -0,0 +1,142 @@
+"""
+Index of the build modules (Maven or Gradle) owning each directory of a tree.
+"""
+__license__ = "MIT"
+
+from pygit2 import GIT_DELTA_ADDED, GIT_DELTA_COPIED, GIT_DELTA_DELETED
+
+MODULE_MODES = ["directory", "build"]
+DEFAULT_MODULE_MODE = "directory"
+
+BUILD_FILES = frozenset(["pom.xml", "build.gradle", "build.gradle.kts"])
+
+DEFAULT_TREE_CACHE_SIZE = 65536
+
+
+def split_path(path):
+    """
+    Split a path into its directory and its file name.
+    """
+    directory, _, name = path.rpartition('/')
+    return directory, name
+
+
+class BuildModuleIndex:
+    """
+    Maps every directory of the tree of the last seen commit to its build
+    module, which is the nearest directory above it containing a build file.
+    Files that are not inside any build module belong to the root module "".
+
+    The build files are only counted from the whole tree when the index is
+    reset. After that, the index is updated from the deltas of each diff, and
+    the directory lookups are only invalidated when a build file is added or
+    deleted. Looking up the module of a file is then a dict lookup.
+    """
+
+    def __init__(self, repo, tree_cache_size=DEFAULT_TREE_CACHE_SIZE):
+        self.repo = repo
+        self.tree_cache_size = tree_cache_size
+
+        self.commit_id = None
+        self.build_files = {}
+        self.directories = {}
+
+        self._trees = {}
+
+    def reset(self, tree):
+        """
+        Count the build files of every directory in a tree.
+        """
+        self.build_files = dict(self._count_tree(tree.id))
+        self.directories = {}
+
+    def update(self, commit, parent, diff):
+        """
+        Bring the index up to date with a commit given the diff against its
+        first parent. If the parent is not the last seen commit, the build files
+        of the tree are counted from scratch.
+        """
+        if parent is None or str(parent.hex) != self.commit_id:
+            self.reset(commit.tree)
+            self.commit_id = str(commit.hex)
+            return
+
+        changed = False
+        for delta in diff.deltas:
+            if delta.status in (GIT_DELTA_ADDED, GIT_DELTA_COPIED):
+                changed |= self._add(delta.new_file.path)
+            elif delta.status == GIT_DELTA_DELETED:
+                changed |= self._remove(delta.old_file.path)
+
+        if changed:
+            self.directories = {}
+        self.commit_id = str(commit.hex)
+
+    def get_module(self, path):
+        """
+        Get the build module of a file.
+        """
+        return self._get_directory_module(split_path(path)[0])
+
+    @property
+    def modules(self):
+        """
+        All build modules of the tree, including the root module.
+        """
+        return set(self.build_files) | set([""])
+
+    def _get_directory_module(self, directory):
+        module = self.directories.get(directory)
+        if module is None:
+            if directory in self.build_files or not directory:
+                module = directory
+            else:
+                module = self._get_directory_module(split_path(directory)[0])
+            self.directories[directory] = module
+        return module
+
+    def _add(self, path):
+        directory, name = split_path(path)
+        if name not in BUILD_FILES:
+            return False
+        self.build_files[directory] = self.build_files.get(directory, 0) + 1
+        return True
+
+    def _remove(self, path):
+        directory, name = split_path(path)
+        if name not in BUILD_FILES or directory not in self.build_files:
+            return False
+        self.build_files[directory] -= 1
+        if self.build_files[directory] == 0:
+            del self.build_files[directory]
+        return True
+
+    def _count_tree(self, tree_id):
+        """
+        Get the directories below a tree that contain build files, together with
+        the number of build files in each. Unchanged subtrees keep their ids
+        between commits, so the result of every tree is cached.
+        """
+        key = str(tree_id)
+        counts = self._trees.get(key)
+        if counts is not None:
+            return counts
+
+        counts = []
+        own = 0
+        for entry in self.repo[tree_id]:
+            if entry.type_str == "tree":
+                for directory, count in self._count_tree(entry.id):
+                    counts.append(
+                        (entry.name + '/' + directory if directory else
+                         entry.name, count))
+            elif entry.name in BUILD_FILES:
+                own += 1
+        if own:
+            counts.append(("", own))
+        counts = tuple(counts)
+
+        if len(self._trees) >= self.tree_cache_size:
+            self._trees.clear()
+        self._trees[key] = counts
+        return counts
@@ -0,0 +1,91 @@
+"""
+Sparse commit x file matrices with the lines added and deleted per file.
+"""
+__license__ = "MIT"
+
+import csv
+
+from array import array
+
+import numpy as np
+from scipy.sparse import coo_matrix, load_npz, save_npz
+
+
+class ChurnMatrix:
+    """
+    Collects the added and deleted lines of every file in every commit. Paths are
+    interned to column indices and the entries are kept as COO triplets in compact
+    arrays until the matrix is saved.
+    """
+
+    def __init__(self):
+        self.commits = []
+        self.files = {}
+
+        self._rows = array('q')
+        self._cols = array('q')
+        self._added = array('q')
+        self._deleted = array('q')
+
+    def add_commit(self, commit_hex, file_churns):
+        """
+        Add a row for a commit given (path, added, deleted) for each changed file.
+        """
+        row = len(self.commits)
+        self.commits.append(commit_hex)
+
+        for path, added, deleted in file_churns:
+            col = self.files.setdefault(path, len(self.files))
+            self._rows.append(row)
+            self._cols.append(col)
+            self._added.append(added)
+            self._deleted.append(deleted)
+
+    def save(self, prefix):
+        """
+        Save the added and deleted lines as two CSR matrices in .npz files, together
+        with the commit of each row and the path of each column.
+        """
+        shape = (len(self.commits), len(self.files))
+        rows = np.frombuffer(self._rows, dtype=np.int64)
+        cols = np.frombuffer(self._cols, dtype=np.int64)
+
+        for name, values in (("added", self._added), ("deleted",
+                                                        self._deleted)):
+            matrix = coo_matrix(
+                (np.frombuffer(values, dtype=np.int64), (rows, cols)),
+                shape=shape)
+            save_npz("{}_{}.npz".format(prefix, name), matrix.tocsr())
+
+        with open("{}_commits.csv".format(prefix), 'w') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(["row", "commit"])
+            for row, commit_hex in enumerate(self.commits):
+                writer.writerow([row, commit_hex])
+
+        with open("{}_files.csv".format(prefix), 'w') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(["column", "path"])
+            for path, col in self.files.items():
+                writer.writerow([col, path])
+
+
+def load_churn_matrix(prefix):
+    """
+    Load a churn matrix saved by ChurnMatrix.save. Returns the added and deleted
+    CSR matrices, the commits of the rows and the paths of the columns.
+    """
+    added = load_npz("{}_added.npz".format(prefix))
+    deleted = load_npz("{}_deleted.npz".format(prefix))
+
+    with open("{}_commits.csv".format(prefix), 'r') as inp:
+        reader = csv.reader(inp)
+        next(reader)
+        commits = [row[1] for row in reader]
+
+    with open("{}_files.csv".format(prefix), 'r') as inp:
+        reader = csv.reader(inp)
+        next(reader)
+        files = [row[1] for row in reader]
+
+    return added, deleted, commits, files
@@ -0,0 +1,171 @@
+"""
+Helpers to diff commits against their actual parents and to distribute
+commits between worker processes.
+"""
+__license__ = "MIT"
+
+MERGE_POLICIES = ["first-parent", "skip", "combine"]
+DEFAULT_MERGE_POLICY = "first-parent"
+
+DEFAULT_SHARD_BLOCK = 64
+
+
+def get_parent_diff(repo, commit, merge_policy=DEFAULT_MERGE_POLICY):
+    """
+    Diff a commit against its first parent. Returns the parent and the diff.
+    A root commit is diffed against the empty tree and gets None as parent.
+    Merges return None if the merge policy says that they should be skipped.
+    """
+    if not commit.parents:
+        return None, commit.tree.diff_to_tree(swap=True)
+
+    if len(commit.parents) > 1 and merge_policy == "skip":
+        return None
+
+    parent = commit.parents[0]
+    return parent, repo.diff(parent, commit)
+
+
+def get_patches(repo, commit, diff, merge_policy=DEFAULT_MERGE_POLICY,
+                patches=None):
+    """
+    Get the patches of a diff taken against the first parent of a commit.
+    With the combine policy, only the files of a merge that differ from every
+    parent are kept, like in a combined diff. Patches that have already been
+    created for the diff, e.g. by the large commit guard, can be given to
+    avoid creating them again.
+    """
+    if patches is None:
+        patches = [p for p in diff]
+    if merge_policy != "combine" or len(commit.parents) < 2:
+        return patches
+
+    changed = get_combined_paths(repo, commit)
+    return [p for p in patches if p.delta.new_file.path in changed]
+
+
+def get_combined_paths(repo, commit):
+    """
+    Get the paths of a merge that differ from each of its parents except the
+    first one. Only the deltas are computed, no patches.
+    """
+    changed = None
+    for parent in commit.parents[1:]:
+        paths = set(
+            [d.new_file.path for d in repo.diff(parent, commit).deltas])
+        changed = paths if changed is None else changed & paths
+    return changed
+
+
+def shard_commits(commits, shards, block=DEFAULT_SHARD_BLOCK):
+    """
+    Distribute commits between a number of shards. Since every commit is
+    diffed against its own parents, any commit can go to any shard. Blocks of
+    consecutive commits are dealt round-robin, which spreads the expensive
+    parts of the history evenly while keeping parents and children close.
+    """
+    parts = [[] for _ in range(shards)]
+    for i in range(0, len(commits), block):
+        parts[(i // block) % shards].extend(commits[i:i + block])
+    return parts
+
+
+class LargeCommitGuard:
+    """
+    Detects commits that are too large to be processed patch by patch, such as
+    vendor imports or mass reformatting. A commit is large if it touches more
+    files, changes more lines or contains a bigger blob than the limits allow.
+    The number of files is read from the deltas alone, so it is checked first.
+    The blob sizes are only known once the blobs have been loaded, so they are
+    checked together with the changed lines while the patches are created one
+    at a time, stopping at the first patch over a limit. The patches of a
+    commit under the limits are kept so that they can be used instead of
+    diffing the commit again. Large commits should be processed with the stats
+    only, or with the delta headers only if the mode is "header".
+    """
+
+    def __init__(self, max_files=None, max_lines=None, max_blob_size=None,
+                 mode="stats"):
+        self.max_files = max_files
+        self.max_lines = max_lines
+        self.max_blob_size = max_blob_size
+        self.mode = mode
+
+    @property
+    def enabled(self):
+        """
+        Whether any limit is set.
+        """
+        return any(
+            limit is not None
+            for limit in (self.max_files, self.max_lines, self.max_blob_size))
+
+    def check(self, diff):
+        """
+        Check a diff against the limits. Returns whether the commit is large and
+        the patches of the diff if they had to be created, otherwise None.
+        """
+        if self.max_files is not None and len(diff) > self.max_files:
+            return True, None
+        if self.max_lines is None and self.max_blob_size is None:
+            return False, None
+
+        patches = []
+        lines = 0
+        for patch in diff:
+            if self.max_blob_size is not None and \
+               max(patch.delta.old_file.size,
+                   patch.delta.new_file.size) > self.max_blob_size:
+                return True, None
+            if self.max_lines is not None:
+                _, additions, deletions = patch.line_stats
+                lines += additions + deletions
+                if lines > self.max_lines:
+                    return True, None
+            patches.append(patch)
+        return False, patches
+
+    def get_stats(self, diff):
+        """
+        Get the stats of a large diff, or None in header mode.
+        """
+        if self.mode == "stats":
+            return diff.stats
+        return None
+
+
+def add_guard_arguments(parser):
+    """
+    Add the command line options of the large commit guard to a parser.
+    """
+    parser.add_argument(
+        "--max-files",
+        type=int,
+        default=None,
+        help="Commits touching more files are processed as large commits.")
+    parser.add_argument(
+        "--max-lines",
+        type=int,
+        default=None,
+        help="Commits changing more lines are processed as large commits.")
+    parser.add_argument(
+        "--max-blob-size",
+        type=int,
+        default=None,
+        help="Commits with a bigger blob (in bytes) are processed as large " +
+        "commits.")
+    parser.add_argument(
+        "--large-commit-mode",
+        type=str,
+        choices=["stats", "header"],
+        default="stats",
+        help="Process large commits with the diff stats only or with the " +
+        "file headers only.")
+
+
+def get_guard(args):
+    """
+    Create a large commit guard from parsed command line options.
+    """
+    return LargeCommitGuard(args.max_files, args.max_lines, args.max_blob_size,
+                            args.large_commit_mode)
@@ -0,0 +1,60 @@
+"""
+Index from commit hashes to commit timestamps.
+"""
+__license__ = "MIT"
+
+from array import array
+
+import numpy as np
+
+
+class CommitTimeIndex:
+    """
+    Maps commit hashes to dense ids and keeps the commit time of every id in a
+    NumPy array, so the times of many commits can be gathered at once without
+    reading any objects from the repository.
+    """
+
+    def __init__(self, commits=None):
+        self.ids = {}
+        self._times = array('q')
+        self._array = None
+
+        for commit in commits or []:
+            self.add(commit)
+
+    def add(self, commit):
+        """
+        Add a commit to the index and return its id.
+        """
+        key = str(commit.hex)
+        commit_id = self.ids.get(key)
+        if commit_id is None:
+            commit_id = len(self._times)
+            self.ids[key] = commit_id
+            self._times.append(commit.commit_time)
+            self._array = None
+        return commit_id
+
+    @property
+    def times(self):
+        """
+        The commit times of all ids as a NumPy array.
+        """
+        if self._array is None:
+            self._array = np.frombuffer(self._times, dtype=np.int64).copy()
+        return self._array
+
+    def get_times(self, hexes):
+        """
+        Get the commit times of a list of commit hashes.
+        """
+        ids = np.fromiter((self.ids[h] for h in hexes), dtype=np.int64,
+                          count=len(hexes))
+        return self.times[ids]
+
+    def get_time(self, commit_hex):
+        """
+        Get the commit time of a commit hash.
+        """
+        return int(self._times[self.ids[commit_hex]])
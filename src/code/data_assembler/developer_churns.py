@@ -0,0 +1,101 @@
+"""
+Per-developer code churn aggregated over time windows.
+"""
+__license__ = "MIT"
+
+import csv
+import heapq
+
+from datetime import datetime, timezone
+
+from time_windows import SECONDS_PER_DAY
+
+DEFAULT_WINDOWS = [30, 90, 365]
+
+
+class DeveloperChurns:
+    """
+    Rolling sums of the lines added and deleted, the churned files and the
+    number of commits of every author over the last days of each window size.
+    Every author and window size has one counter: a heap of the commits that
+    are still inside the window, ordered by time, the running sums over them
+    and the time of the newest commit seen. The commits may be added in any
+    order, e.g. newest first or from several processes, and the window always
+    ends at the newest commit seen. Commits that fall out of the window are
+    popped from the heap, so the memory of a counter is bounded by the
+    activity of the author within the window and not by the whole history.
+    """
+
+    def __init__(self, windows=None):
+        self.windows = list(windows) if windows else list(DEFAULT_WINDOWS)
+        self.counters = {}
+
+    def add(self, author, commit_time, added, deleted, files):
+        """
+        Add the churn of a commit made by an author at a unix timestamp.
+        """
+        for days in self.windows:
+            key = (author, days)
+
+            counter = self.counters.get(key)
+            if counter is None:
+                counter = [[], 0, 0, 0, 0, commit_time]
+                self.counters[key] = counter
+            heapq.heappush(counter[0], (commit_time, added, deleted, files))
+            counter[1] += added
+            counter[2] += deleted
+            counter[3] += files
+            counter[4] += 1
+            counter[5] = max(counter[5], commit_time)
+            _expire(counter, counter[5] - days * SECONDS_PER_DAY)
+
+    def update(self, counters):
+        """
+        Merge counters produced by another instance, e.g. in another process.
+        The commits of both counters are merged and expired against the newest
+        commit of either.
+        """
+        for key, other in counters.items():
+            counter = self.counters.get(key)
+            if counter is None:
+                self.counters[key] = other
+                continue
+            counter[0].extend(other[0])
+            heapq.heapify(counter[0])
+            for i in range(1, 5):
+                counter[i] += other[i]
+            counter[5] = max(counter[5], other[5])
+            _expire(counter, counter[5] - key[1] * SECONDS_PER_DAY)
+
+    def save(self, path):
+        """
+        Save the aggregates as a csv file with one row per author and window.
+        The table is a snapshot at the newest commit of the repository: every
+        window ends at that time, for all authors, so an author without
+        commits in the last days of a window gets a row of zeros for it.
+        """
+        end = max([c[5] for c in self.counters.values()] or [0])
+        for (_, days), counter in self.counters.items():
+            _expire(counter, end - days * SECONDS_PER_DAY)
+        end = datetime.fromtimestamp(end, timezone.utc)
+
+        with open(path, 'w') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow([
+                "author", "window_days", "window_end", "lines_added",
+                "lines_deleted", "files_churned", "commits"
+            ])
+            for key in sorted(self.counters):
+                author, days = key
+                writer.writerow([author, days, end.strftime("%Y-%m-%d")] +
+                                self.counters[key][1:5])
+
+
+def _expire(counter, cutoff):
+    events = counter[0]
+    while events and events[0][0] < cutoff:
+        _, added, deleted, files = heapq.heappop(events)
+        counter[1] -= added
+        counter[2] -= deleted
+        counter[3] -= files
+        counter[4] -= 1
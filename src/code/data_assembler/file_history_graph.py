@@ -0,0 +1,543 @@
+"""
+Compact file history graph used by the history features. For every file and
+every commit that touched it, the graph stores the previous commit that touched
+the file and the set of authors that have touched it so far.
+"""
+__license__ = "MIT"
+
+import os
+import shutil
+import sqlite3
+
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
+NO_COMMIT = -1
+EMPTY_AUTHORS = -1
+
+# Number of records kept in memory before they are spilled to disk
+DEFAULT_SPILL_BLOCK = 1 << 20
+
+RECORD_ARRAYS = ["file", "commit", "prev", "authors"]
+
+
+def encode_strings(strings):
+    """
+    Encode a list of strings as one utf-8 blob and the offsets of the strings.
+    """
+    blob = bytearray()
+    offsets = array('q', [0])
+    for string in strings:
+        blob.extend(string.encode("utf-8", "surrogateescape"))
+        offsets.append(len(blob))
+    return (np.frombuffer(bytes(blob), dtype=np.uint8),
+            np.frombuffer(offsets, dtype=np.int64))
+
+
+def decode_strings(blob, offsets):
+    """
+    Decode strings encoded with encode_strings.
+    """
+    data = bytes(blob)
+    return [
+        data[offsets[i]:offsets[i + 1]].decode("utf-8", "surrogateescape")
+        for i in range(len(offsets) - 1)
+    ]
+
+
+class AuthorSets:
+    """
+    Author sets stored as shared linked lists. A set is the id of a node that
+    holds one author and the id of the set without that author, so all the
+    sets of a file share their common part and adding an author to a set
+    costs one node.
+    """
+
+    def __init__(self, authors=None, parents=None):
+        self.authors = array('i') if authors is None else authors
+        self.parents = array('i') if parents is None else parents
+
+    def add(self, authors, author):
+        """
+        Get the set of authors with an author added.
+        """
+        node = authors
+        while node != EMPTY_AUTHORS:
+            if self.authors[node] == author:
+                return authors
+            node = self.parents[node]
+
+        self.authors.append(author)
+        self.parents.append(authors)
+        return len(self.authors) - 1
+
+    def get(self, authors):
+        """
+        Get the author ids of a set.
+        """
+        result = set()
+        while authors != EMPTY_AUTHORS:
+            result.add(int(self.authors[authors]))
+            authors = int(self.parents[authors])
+        return result
+
+
+class ArrayWriter:
+    """
+    Writes a one dimensional .npy file in chunks, so the array never has to be
+    held in memory. The chunks are written to a temporary file, and the header
+    with the final length is written in front of them when it is closed.
+    """
+
+    def __init__(self, path, dtype):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.length = 0
+        self._raw = open(path + ".tmp", 'wb')
+
+    def write(self, values):
+        """
+        Append values to the array.
+        """
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        values.tofile(self._raw)
+        self.length += len(values)
+
+    def close(self):
+        """
+        Write the .npy file and remove the temporary file.
+        """
+        self._raw.close()
+        with open(self.path, 'wb') as output:
+            np.lib.format.write_array_header_1_0(output, {
+                "descr": np.lib.format.dtype_to_descr(self.dtype),
+                "fortran_order": False,
+                "shape": (self.length, )
+            })
+            with open(self.path + ".tmp", 'rb') as raw:
+                shutil.copyfileobj(raw, output)
+        os.remove(self.path + ".tmp")
+
+
+class FileState:
+    """
+    The state of a file while the graph is built: its id, the last commit that
+    touched it, and its authors both as a node of the saved author sets and as
+    a set of author ids.
+    """
+
+    def __init__(self, file_id, commit=NO_COMMIT, commit_hex="",
+                 authors_node=EMPTY_AUTHORS, authors=None):
+        self.file_id = file_id
+        self.commit = commit
+        self.commit_hex = commit_hex
+        self.authors_node = authors_node
+        self.authors = set() if authors is None else authors
+
+
+class GraphStore:
+    """
+    On-disk store of a FileHistoryGraphBuilder. It holds the state of the
+    files that have been evicted from memory, keyed by their names, and the
+    blocks of commits, file names, author set nodes and records that have
+    been flushed. A record replaces an earlier record of the same file and
+    commit.
+    """
+
+    def __init__(self, path):
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        db_path = os.path.join(path, "file_graph.db")
+        if os.path.exists(db_path):
+            os.remove(db_path)
+        self._db = sqlite3.connect(db_path)
+        self._db.execute("PRAGMA journal_mode=OFF")
+        self._db.execute("PRAGMA synchronous=OFF")
+        self._db.execute("CREATE TABLE file_state (name PRIMARY KEY, "
+                         "file INTEGER, last_commit INTEGER, last_hex TEXT, "
+                         "authors_node INTEGER, authors BLOB)")
+        self._db.execute("CREATE TABLE commits (id INTEGER PRIMARY KEY, "
+                         "hex TEXT)")
+        self._db.execute("CREATE TABLE files (id INTEGER PRIMARY KEY, name)")
+        self._db.execute("CREATE TABLE author_sets (id INTEGER PRIMARY KEY, "
+                         "author INTEGER, parent INTEGER)")
+        self._db.execute("CREATE TABLE records (file INTEGER, "
+                         "commit_id INTEGER, prev INTEGER, authors INTEGER, "
+                         "PRIMARY KEY (file, commit_id)) WITHOUT ROWID")
+
+    def put(self, name, state):
+        """
+        Store the state of an evicted file.
+        """
+        self._db.execute(
+            "INSERT OR REPLACE INTO file_state VALUES (?, ?, ?, ?, ?, ?)",
+            (name, state.file_id, state.commit, state.commit_hex,
+             state.authors_node, array('i', state.authors).tobytes()))
+
+    def pop(self, name):
+        """
+        Remove and return the state of a file, or None if it is not stored.
+        """
+        row = self._db.execute(
+            "SELECT file, last_commit, last_hex, authors_node, authors "
+            "FROM file_state WHERE name = ?", (name, )).fetchone()
+        if row is None:
+            return None
+        self._db.execute("DELETE FROM file_state WHERE name = ?", (name, ))
+        authors = array('i')
+        authors.frombytes(row[4])
+        return FileState(row[0], row[1], row[2], row[3], set(authors))
+
+    def flush(self, first_ids, commits, names, author_sets, records):
+        """
+        Append blocks of commits, file names, author set nodes and records.
+        The first ids give the id of the first commit, file and node of the
+        blocks.
+        """
+        first_commit, first_file, first_set = first_ids
+        self._db.executemany("INSERT INTO commits VALUES (?, ?)",
+                             enumerate(commits, first_commit))
+        self._db.executemany("INSERT INTO files VALUES (?, ?)",
+                             enumerate(names, first_file))
+        self._db.executemany(
+            "INSERT INTO author_sets VALUES (?, ?, ?)",
+            ((first_set + i, author, parent)
+             for i, (author, parent) in enumerate(zip(*author_sets))))
+        self._db.executemany(
+            "INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?)",
+            zip(*records))
+        self._db.commit()
+
+    def iter_blocks(self, table, block):
+        """
+        Read a flushed table in blocks of rows, ordered by its key.
+        """
+        queries = {
+            "commits": "SELECT hex FROM commits ORDER BY id",
+            "files": "SELECT name FROM files ORDER BY id",
+            "author_sets": "SELECT author, parent FROM author_sets ORDER BY id",
+            "records": "SELECT file, commit_id, prev, authors FROM records "
+                       "ORDER BY file, commit_id"
+        }
+        cursor = self._db.execute(queries[table])
+        while True:
+            rows = cursor.fetchmany(block)
+            if not rows:
+                return
+            yield rows
+
+    def close(self):
+        """
+        Close the database of the store.
+        """
+        self._db.close()
+
+
+class FileHistoryGraphBuilder:
+    """
+    Builds the file history graph one commit at a time. The files of a commit
+    must be recorded one after the other. Commits are numbered in the order
+    they are recorded, authors are interned to integer ids and files get an id
+    when they are first seen. Files are either keyed by their paths or by
+    integer ids, e.g. from a FileLineage.
+
+    Without a spill path, everything is kept in memory until the graph is
+    saved. With a spill path, the commits, file names, author set nodes and
+    records are flushed to a GraphStore in blocks and the graph is saved from
+    it in blocks. Only the state of the max_active most recently touched
+    files is then kept in memory, and the state of other files, and of
+    deleted files, is moved to the store, together with their ids, until they
+    are touched again. Bounding the number of active files needs a spill path.
+    """
+
+    def __init__(self, max_active=None, spill_path=None,
+                 spill_block=DEFAULT_SPILL_BLOCK):
+        if max_active is not None and spill_path is None:
+            raise ValueError("Evicting files needs a spill path")
+
+        self.authors = {}
+        self.max_active = max_active
+        self.store = GraphStore(spill_path) if spill_path else None
+        self.spill_block = spill_block
+
+        self.num_commits = 0
+        self.num_files = 0
+        self.num_sets = 0
+        self.hex_length = 40
+        self.int_keys = False
+
+        self._commit_hex = None
+        self._active = OrderedDict()
+        self._flushed = (0, 0, 0)
+        self._clear()
+
+    def update(self, name, commit_hex, author):
+        """
+        Record that a file was touched by a commit. Returns the hash of the
+        previous commit that touched the file (or "") and the ids of the
+        authors that have touched it, including this one, like
+        FileHistoryGraph.get.
+        """
+        if commit_hex != self._commit_hex:
+            self._commit_hex = commit_hex
+            self._commits.append(commit_hex)
+            self.num_commits += 1
+            self.hex_length = max(self.hex_length, len(commit_hex))
+        commit = self.num_commits - 1
+        author = _intern(self.authors, author)
+
+        state = self._active.pop(name, None)
+        if state is None and self.store is not None:
+            state = self.store.pop(name)
+        if state is None:
+            state = FileState(self._add_file(name))
+
+        prev, prev_hex = state.commit, state.commit_hex
+        if author not in state.authors:
+            state.authors.add(author)
+            state.authors_node = self._add_author(state.authors_node, author)
+        state.commit, state.commit_hex = commit, commit_hex
+        self._active[name] = state
+
+        if self.max_active is not None:
+            while len(self._active) > self.max_active:
+                self.store.put(*self._active.popitem(last=False))
+
+        for values, value in zip(self._records,
+                                 (state.file_id, commit, prev,
+                                  state.authors_node)):
+            values.append(value)
+        if self.store is not None and \
+           len(self._records[0]) >= self.spill_block:
+            self._flush()
+        return prev_hex, set(state.authors)
+
+    def evict(self, name):
+        """
+        Move the state of a file out of memory, e.g. when it has been deleted.
+        Nothing is evicted without a spill path.
+        """
+        if self.store is None:
+            return
+        state = self._active.pop(name, None)
+        if state is not None:
+            self.store.put(name, state)
+
+    def save(self, path):
+        """
+        Save the graph as a directory of .npy files that can be memory mapped.
+        The records are sorted by file and commit, and if a file was recorded
+        twice for the same commit, the last record is kept. The arrays are
+        written in blocks, so a graph built with a spill path is never read
+        into memory. The keys of the files of an earlier graph saved to the
+        same directory are removed, since they may be of the other kind.
+        """
+        if not os.path.exists(path):
+            os.makedirs(path)
+        stale = ["paths", "path_offsets"] if self.int_keys else ["file_keys"]
+        for name in stale:
+            if os.path.exists(os.path.join(path, name + ".npy")):
+                os.remove(os.path.join(path, name + ".npy"))
+
+        def writer(name, dtype):
+            return ArrayWriter(os.path.join(path, name + ".npy"), dtype)
+
+        if self.store is not None:
+            self._flush()
+
+        commits = writer("commits", "S{}".format(self.hex_length))
+        for block in self._iter_blocks("commits"):
+            commits.write([row[0] for row in block])
+        commits.close()
+
+        if self.int_keys:
+            keys = writer("file_keys", np.int64)
+            for block in self._iter_blocks("files"):
+                keys.write([row[0] for row in block])
+            keys.close()
+        else:
+            _write_strings(
+                (row[0] for block in self._iter_blocks("files")
+                 for row in block), writer("paths", np.uint8),
+                writer("path_offsets", np.int64))
+
+        set_authors = writer("set_authors", np.int32)
+        set_parents = writer("set_parents", np.int32)
+        for block in self._iter_blocks("author_sets"):
+            block = np.array(block, dtype=np.int32).reshape(-1, 2)
+            set_authors.write(block[:, 0])
+            set_parents.write(block[:, 1])
+        set_authors.close()
+        set_parents.close()
+
+        self._save_records(writer)
+
+        _write_strings(self.authors, writer("authors", np.uint8),
+                       writer("author_offsets", np.int64))
+
+        if self.store is not None:
+            self.store.close()
+
+    def _save_records(self, writer):
+        file_records = writer("file_records", np.int64)
+        columns = [writer(name, np.int32) for name in
+                   ["record_commit", "record_prev", "record_authors"]]
+
+        next_file = 0
+        count = 0
+        for block in self._iter_blocks("records"):
+            block = np.array(block, dtype=np.int32).reshape(-1, 4)
+            files = block[:, 0]
+            if len(files) == 0:
+                continue
+            file_records.write(count + np.searchsorted(
+                files, np.arange(next_file, files[-1] + 1)))
+            next_file = int(files[-1]) + 1
+            count += len(files)
+            for column, values in zip(columns, block[:, 1:].T):
+                column.write(values)
+        file_records.write(np.full(self.num_files + 1 - next_file, count))
+
+        file_records.close()
+        for column in columns:
+            column.close()
+
+    def _iter_blocks(self, table):
+        if self.store is not None:
+            for block in self.store.iter_blocks(table, self.spill_block):
+                yield block
+        elif table == "commits":
+            yield [(commit_hex, ) for commit_hex in self._commits]
+        elif table == "files":
+            yield [(name, ) for name in self._names]
+        elif table == "author_sets":
+            yield list(zip(self._set_authors, self._set_parents))
+        else:
+            yield _sort_records(self._records)
+
+    def _add_file(self, name):
+        if self.num_files == 0:
+            self.int_keys = isinstance(name, int)
+        self._names.append(name)
+        self.num_files += 1
+        return self.num_files - 1
+
+    def _add_author(self, authors_node, author):
+        self._set_authors.append(author)
+        self._set_parents.append(authors_node)
+        self.num_sets += 1
+        return self.num_sets - 1
+
+    def _flush(self):
+        self.store.flush(self._flushed, self._commits, self._names,
+                         (self._set_authors, self._set_parents),
+                         self._records)
+        self._flushed = (self.num_commits, self.num_files, self.num_sets)
+        self._clear()
+
+    def _clear(self):
+        self._commits = []
+        self._names = []
+        self._set_authors = array('i')
+        self._set_parents = array('i')
+        self._records = [array('i') for _ in RECORD_ARRAYS]
+
+
+def _sort_records(records):
+    """
+    Sort in-memory records by file and commit and keep the last record of
+    every file and commit.
+    """
+    files, commits, prevs, authors = [
+        np.frombuffer(r, dtype=np.int32) for r in records]
+    order = np.lexsort((np.arange(len(files)), commits, files))
+
+    files, commits = files[order], commits[order]
+    last = np.ones(len(order), dtype=bool)
+    last[:-1] = (files[1:] != files[:-1]) | (commits[1:] != commits[:-1])
+    order = order[last]
+    return np.stack([files[last], commits[last], prevs[order],
+                     authors[order]], axis=1)
+
+
+def _write_strings(strings, blob, offsets):
+    """
+    Write strings like encode_strings with two ArrayWriters, in blocks.
+    """
+    base = 0
+    offsets.write([0])
+    block = []
+    for string in strings:
+        block.append(string)
+        if len(block) >= DEFAULT_SPILL_BLOCK:
+            base = _write_string_block(block, blob, offsets, base)
+            block = []
+    _write_string_block(block, blob, offsets, base)
+    blob.close()
+    offsets.close()
+
+
+def _write_string_block(strings, blob, offsets, base):
+    if not strings:
+        return base
+    values, ends = encode_strings(strings)
+    blob.write(values)
+    offsets.write(ends[1:] + base)
+    return base + len(values)
+
+
+class FileHistoryGraph:
+    """
+    A saved file history graph. The arrays are memory mapped, so only the
+    interning tables of the commits and the files are read into memory.
+    """
+
+    def __init__(self, path):
+        def load(name):
+            return np.load(os.path.join(path, name + ".npy"), mmap_mode='r')
+
+        self.file_records = load("file_records")
+        self.record_commit = load("record_commit")
+        self.record_prev = load("record_prev")
+        self.record_authors = load("record_authors")
+        self.author_sets = AuthorSets(load("set_authors"), load("set_parents"))
+
+        self.commits = [c.decode("ascii") for c in load("commits")]
+        self.commit_ids = {c: i for i, c in enumerate(self.commits)}
+        if os.path.exists(os.path.join(path, "file_keys.npy")):
+            keys = [int(k) for k in load("file_keys")]
+        else:
+            keys = decode_strings(load("paths"), load("path_offsets"))
+        self.files = {k: i for i, k in enumerate(keys)}
+
+    def get(self, name, commit_hex):
+        """
+        Get the previous commit that touched a file (a path or a file id) before
+        a commit (or "") and the ids of the authors that had touched it, or None
+        if the commit did not touch the file.
+        """
+        file_id = self.files.get(name)
+        commit = self.commit_ids.get(commit_hex)
+        if file_id is None or commit is None:
+            return None
+
+        start = self.file_records[file_id]
+        end = self.file_records[file_id + 1]
+        index = start + np.searchsorted(self.record_commit[start:end], commit)
+        if index == end or self.record_commit[index] != commit:
+            return None
+
+        prev = int(self.record_prev[index])
+        authors = self.author_sets.get(int(self.record_authors[index]))
+        return (self.commits[prev] if prev != NO_COMMIT else "", authors)
+
+
+def _intern(table, key):
+    value = table.get(key)
+    if value is None:
+        value = len(table)
+        table[key] = value
+    return value
@@ -0,0 +1,75 @@
+"""
+Rename-aware index from paths to stable file ids.
+"""
+__license__ = "MIT"
+
+from pygit2 import GIT_DELTA_DELETED, GIT_DELTA_RENAMED, GIT_DIFF_FIND_RENAMES
+
+DEFAULT_SIMILARITY = 50
+DEFAULT_RENAME_LIMIT = 1000
+
+
+class FileLineage:
+    """
+    Follows the files of a repository through a walk and gives every file a
+    stable id that is kept when the file is renamed. Renames are found by
+    libgit2 with the given similarity threshold (in percent). The rename limit
+    caps the number of added and deleted files that are compared against each
+    other, so huge commits do not blow up the rename detection.
+    """
+
+    def __init__(self, similarity=DEFAULT_SIMILARITY,
+                 rename_limit=DEFAULT_RENAME_LIMIT):
+        self.similarity = similarity
+        self.rename_limit = rename_limit
+
+        self.paths = {}
+        self.next_id = 0
+
+    def get_id(self, path):
+        """
+        Get the id of the file currently at a path.
+        """
+        file_id = self.paths.get(path)
+        if file_id is None:
+            file_id = self.next_id
+            self.next_id += 1
+            self.paths[path] = file_id
+        return file_id
+
+    def update(self, diff):
+        """
+        Detect the renames of a diff and move the ids of the renamed files to
+        their new paths. Returns the id of the file of every delta, in the same
+        order as the deltas. Deleted files keep their id in the result but are
+        removed from the index.
+        """
+        diff.find_similar(
+            flags=GIT_DIFF_FIND_RENAMES,
+            rename_threshold=self.similarity,
+            rename_limit=self.rename_limit)
+
+        # Moves are applied after all ids have been read, so that swapped
+        # paths keep their own ids.
+        file_ids = []
+        moves = []
+        for delta in diff.deltas:
+            if delta.status == GIT_DELTA_RENAMED:
+                file_id = self.get_id(delta.old_file.path)
+                moves.append((delta.old_file.path, delta.new_file.path,
+                              file_id))
+            elif delta.status == GIT_DELTA_DELETED:
+                file_id = self.get_id(delta.old_file.path)
+                moves.append((delta.old_file.path, None, file_id))
+            else:
+                file_id = self.get_id(delta.new_file.path)
+            file_ids.append(file_id)
+
+        for old_path, _, file_id in moves:
+            if self.paths.get(old_path) == file_id:
+                del self.paths[old_path]
+        for _, new_path, file_id in moves:
+            if new_path is not None:
+                self.paths[new_path] = file_id
+
+        return file_ids
@@ -0,0 +1,128 @@
+"""
+Per-file ownership concentration, used as history features.
+"""
+__license__ = "MIT"
+
+from math import log
+
+# Authors with a share of the changes to a file below this percentage are
+# minor contributors of the file
+MINOR_PERCENT = 5
+
+
+def get_ownership_header():
+    """
+    Get the csv header of the ownership features.
+    """
+    return ["top_author_share", "minor_contributors", "author_entropy"]
+
+
+def _xlogx(value):
+    return value * log(value, 2) if value > 0 else 0.0
+
+
+class FileOwners:
+    """
+    The number of changes made by each author to a file. The largest count,
+    the number of minor contributors and the sum of c * log(c) over the counts
+    are kept up to date as the file is changed, so the ownership of the file
+    can be read without looking at its authors. Counts only grow, so the count
+    below which an author is minor only grows as well, and the authors that
+    fall below it are found from the number of authors per count.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.authors_per_count = {}
+        self.total = 0
+        self.top = 0
+        self.minor = 0
+        self.minor_below = 0
+        self.xlogx = 0.0
+
+    def add(self, author):
+        """
+        Add a change by an author.
+        """
+        count = self.counts.get(author, 0)
+        if count > 0:
+            self.authors_per_count[count] -= 1
+            if count < self.minor_below:
+                self.minor -= 1
+
+        self.total += 1
+        minor_below = -(-MINOR_PERCENT * self.total // 100)
+        for below in range(self.minor_below, minor_below):
+            self.minor += self.authors_per_count.get(below, 0)
+        self.minor_below = minor_below
+
+        count += 1
+        self.counts[author] = count
+        self.authors_per_count[count] = \
+            self.authors_per_count.get(count, 0) + 1
+        if count < self.minor_below:
+            self.minor += 1
+
+        self.top = max(self.top, count)
+        self.xlogx += _xlogx(count) - _xlogx(count - 1)
+
+    def get_share(self):
+        """
+        Get the share of the changes made by the top author.
+        """
+        return float(self.top) / self.total
+
+    def get_entropy(self):
+        """
+        Get the entropy in bits of the distribution of changes over authors.
+        """
+        return max(0.0, log(self.total, 2) - self.xlogx / self.total)
+
+
+class FileOwnership:
+    """
+    Keeps the owners of every file, keyed like the history graph by paths or
+    file ids. Deleted files are forgotten.
+    """
+
+    def __init__(self):
+        self.files = {}
+
+    @staticmethod
+    def get_initial_features():
+        """
+        Get the ownership features of the first commit.
+        """
+        return [str(1.0), str(0.0), str(0.0)]
+
+    def update(self, author, names, deleted=()):
+        """
+        Add a commit by an author that changed some files and get its
+        ownership features, which include the commit. They are the mean share
+        of the top author, the largest number of minor contributors and the
+        mean author entropy over the files.
+        """
+        shares = []
+        minors = []
+        entropies = []
+        for name in names:
+            owners = self.files.get(name)
+            if owners is None:
+                owners = FileOwners()
+                self.files[name] = owners
+            owners.add(author)
+
+            shares.append(owners.get_share())
+            minors.append(owners.minor)
+            entropies.append(owners.get_entropy())
+
+        for name in deleted:
+            self.files.pop(name, None)
+
+        if not names:
+            return self.get_initial_features()
+        return [
+            str(sum(shares) / len(shares)),
+            str(float(max(minors))),
+            str(sum(entropies) / len(entropies))
+        ]
@@ -0,0 +1,159 @@
+"""
+Helpers to read the history of a repository from a single streaming git log
+process instead of diffing every commit in-process.
+"""
+__license__ = "MIT"
+
+import subprocess
+
+from collections import namedtuple
+
+COMMIT_MARKER = "\x01"
+FIELD_SEPARATOR = "\x02"
+ZERO_OID = "0" * 40
+
+LogCommit = namedtuple("LogCommit",
+                       ["hex", "parents", "time", "author", "changes"])
+LogChange = namedtuple(
+    "LogChange",
+    ["path", "status", "old_mode", "new_mode", "old_id", "new_id", "added",
+     "deleted"])
+
+
+def stream_log(repo_path, branch, log_args, chunk_size=1 << 20,
+               person="%ae"):
+    """
+    Run git log with NUL separated output and yield one token at a time. Every
+    commit starts with a token beginning with the commit marker followed by the
+    commit hash and its parents, the commit time and the person given as a git
+    log placeholder, by default the author email.
+    """
+    command = [
+        "git", "-C", repo_path, "-c", "core.quotepath=off", "log", "-z",
+        "--format={0}%H %P{1}%ct{1}{2}".format(COMMIT_MARKER, FIELD_SEPARATOR,
+                                               person)
+    ] + log_args + [branch, "--"]
+    return stream_tokens(command, chunk_size)
+
+
+def stream_tokens(command, chunk_size=1 << 20):
+    """
+    Run a git command with NUL separated output and yield one token at a time.
+    """
+    process = subprocess.Popen(command, stdout=subprocess.PIPE)
+    rest = b""
+    while True:
+        chunk = process.stdout.read(chunk_size)
+        if not chunk:
+            break
+        tokens = (rest + chunk).split(b"\0")
+        rest = tokens.pop()
+        for token in tokens:
+            yield token.decode("utf-8", "surrogateescape").lstrip("\n")
+    if rest:
+        yield rest.decode("utf-8", "surrogateescape").lstrip("\n")
+
+    process.stdout.close()
+    if process.wait() != 0:
+        raise RuntimeError("git exited with {}".format(process.returncode))
+
+
+def read_numstat_log(repo_path, branch):
+    """
+    Read the raw changes and the number of added and deleted lines of every
+    commit in topological order, oldest first. Root commits are diffed against
+    the empty tree and merges against their first parent. Binary files get None
+    as added and deleted lines.
+    """
+    log_args = [
+        "--topo-order", "--reverse", "--root", "--no-renames",
+        "--diff-merges=first-parent", "--raw", "--numstat", "--no-abbrev"
+    ]
+
+    commit = None
+    raw = None
+    tokens = stream_log(repo_path, branch, log_args)
+    for token in tokens:
+        if not token:
+            continue
+        if token.startswith(COMMIT_MARKER):
+            if commit is not None:
+                yield commit
+            ids, commit_time, author = token[1:].split(FIELD_SEPARATOR)
+            ids = ids.split()
+            commit = LogCommit(ids[0], ids[1:], int(commit_time), author, [])
+            raw = {}
+        elif token.startswith(":"):
+            old_mode, new_mode, old_id, new_id, status = token[1:].split()
+            path = next(tokens)
+            raw[path] = len(commit.changes)
+            commit.changes.append(
+                LogChange(path, status[0], old_mode, new_mode, old_id, new_id,
+                          None, None))
+        else:
+            added, deleted, path = token.split("\t", 2)
+            if added == "-":
+                continue
+            index = raw.get(path)
+            if index is not None:
+                commit.changes[index] = commit.changes[index]._replace(
+                    added=int(added), deleted=int(deleted))
+    if commit is not None:
+        yield commit
+
+
+def read_name_only_log(repo_path, branch):
+    """
+    Read the paths changed by every commit in the default git log order, newest
+    first. Merges are diffed against their first parent and root commits
+    against the empty tree. The person of each commit is the committer name,
+    and its changes are the changed paths.
+    """
+    log_args = [
+        "--root", "--no-renames", "--diff-merges=first-parent", "--name-only"
+    ]
+
+    commit = None
+    for token in stream_log(repo_path, branch, log_args, person="%cn"):
+        if not token:
+            continue
+        if token.startswith(COMMIT_MARKER):
+            if commit is not None:
+                yield commit
+            ids, commit_time, committer = token[1:].split(FIELD_SEPARATOR)
+            ids = ids.split()
+            commit = LogCommit(ids[0], ids[1:], int(commit_time), committer,
+                               [])
+        else:
+            commit.changes.append(token)
+    if commit is not None:
+        yield commit
+
+
+def read_tree_paths(repo_path, commit_hex):
+    """
+    Read the paths of all the files in the tree of a commit from a streaming
+    git ls-tree. Submodules are not files of the tree and are skipped.
+    """
+    command = [
+        "git", "-C", repo_path, "ls-tree", "-r", "-z", "--full-tree",
+        commit_hex
+    ]
+    for token in stream_tokens(command):
+        if not token:
+            continue
+        entry, path = token.split("\t", 1)
+        if entry.split()[1] == "blob":
+            yield path
+
+
+def get_first_commit_time(repo_path, branch):
+    """
+    Get the commit time of the last commit of the default git log order, which
+    is the oldest root commit unless commit times are skewed.
+    """
+    output = subprocess.check_output([
+        "git", "-C", repo_path, "log", "--max-parents=0", "--format=%ct",
+        branch, "--"
+    ])
+    return int(output.split()[-1])
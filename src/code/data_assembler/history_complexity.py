@@ -0,0 +1,91 @@
+"""
+Time-decayed history complexity of the changed files, after Hassan's
+entropy based history complexity metric.
+"""
+__license__ = "MIT"
+
+from math import exp, log, log2
+
+from git_log_stream import read_numstat_log
+from time_windows import SECONDS_PER_DAY
+
+DEFAULT_HALF_LIFE = 30
+
+
+class HistoryComplexity:
+    """
+    Keeps an exponentially decayed history complexity for every file. Each
+    commit is a period: the entropy of its changes is spread over the changed
+    files in proportion to their share of the changed lines. The score of a
+    file halves every half_life days, so only a decayed score and the time of
+    the last update are stored per file, and each commit only touches the files
+    it changes.
+    """
+
+    def __init__(self, half_life=DEFAULT_HALF_LIFE):
+        if half_life <= 0:
+            raise ValueError("The half life must be positive")
+        self.decay = log(2) / (half_life * SECONDS_PER_DAY)
+        self.files = {}
+
+    def update(self, commit_time, file_changes, deleted=None):
+        """
+        Add the changes of a commit given as (path, changed lines) at a unix
+        timestamp. Returns the history complexity of the changed files before
+        the commit, i.e. the sum of their decayed scores. Deleted paths are
+        forgotten afterwards.
+        """
+        total = sum([change for _, change in file_changes])
+
+        entropy = 0
+        if total > 0:
+            entropy = -sum([(float(change) / total) * log2(float(change) /
+                                                           total)
+                            for _, change in file_changes if change > 0])
+
+        complexity = 0
+        for path, change in file_changes:
+            score = self._get_score(path, commit_time)
+            complexity += score
+
+            if total > 0:
+                score += entropy * float(change) / total
+            self.files[path] = (score, commit_time)
+
+        for path in deleted or []:
+            self.files.pop(path, None)
+
+        return complexity
+
+    def _get_score(self, path, commit_time):
+        state = self.files.get(path)
+        if state is None:
+            return 0.0
+        score, last_time = state
+        # Topological order does not guarantee increasing commit times
+        return score * exp(-self.decay * max(commit_time - last_time, 0))
+
+
+def get_history_complexity(repo_path, branch, half_life=DEFAULT_HALF_LIFE,
+                           skip_merges=False):
+    """
+    Compute the history complexity of every commit from a single streaming git
+    log, with merges diffed against their first parent or skipped. Combined
+    merge diffs are not supported. Returns a dict from commit hash to the
+    history complexity of its changed files.
+    """
+    history = HistoryComplexity(half_life)
+
+    complexities = {}
+    for commit in read_numstat_log(repo_path, branch):
+        if skip_merges and len(commit.parents) > 1:
+            continue
+
+        # Binary files have no changed lines and are skipped
+        file_changes = [(c.path, c.added + c.deleted) for c in commit.changes
+                        if c.added is not None]
+        deleted = [c.path for c in commit.changes if c.status == "D"]
+
+        complexities[commit.hex] = history.update(commit.time, file_changes,
+                                                  deleted)
+    return complexities
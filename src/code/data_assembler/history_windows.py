@@ -0,0 +1,164 @@
+"""
+Sliding window variants of the history features.
+"""
+__license__ = "MIT"
+
+from collections import deque
+
+from time_windows import SECONDS_PER_DAY
+
+# How many commits to process between removing files without recent changes
+FORGET_INTERVAL = 1000
+
+
+def get_window_header(windows):
+    """
+    Get the csv header of the windowed history features.
+    """
+    header = []
+    for days in windows:
+        header.extend([
+            "number_of_authors_{}d".format(days),
+            "age_{}d".format(days),
+            "number_unique_changes_{}d".format(days)
+        ])
+    return header
+
+
+class FileWindow:
+    """
+    The changes made to a file during one window, ordered by time, with the
+    number of changes per author and per commit among them. Changes are
+    expired from the front of the deque and the counters are updated with
+    them, so the distinct authors and commits are the keys of the counters.
+    """
+
+    def __init__(self):
+        self.events = deque()
+        self.authors = {}
+        self.commits = {}
+
+    def add(self, commit_hex, commit_time, author):
+        """
+        Add a change. Commit times are not ordered topologically, so a change
+        is inserted before the later ones it follows in the walk.
+        """
+        event = (commit_time, commit_hex, author)
+        index = len(self.events)
+        while index > 0 and self.events[index - 1][0] > commit_time:
+            index -= 1
+        self.events.insert(index, event)
+        _count(self.authors, author, 1)
+        _count(self.commits, commit_hex, 1)
+
+    def expire(self, cutoff):
+        """
+        Drop the changes made before a cutoff time. If commit times go back
+        by more than the window, the dropped changes are not counted again.
+        """
+        while self.events and self.events[0][0] < cutoff:
+            _, commit_hex, author = self.events.popleft()
+            _count(self.authors, author, -1)
+            _count(self.commits, commit_hex, -1)
+
+    def get_distinct(self, commit_time):
+        """
+        Get the distinct authors and commits of the changes made at or before
+        a time.
+        """
+        later_authors = {}
+        later_commits = {}
+        for event_time, commit_hex, author in reversed(self.events):
+            if event_time <= commit_time:
+                break
+            _count(later_authors, author, 1)
+            _count(later_commits, commit_hex, 1)
+
+        if not later_commits:
+            return self.authors.keys(), self.commits.keys()
+        return ([a for a, c in self.authors.items()
+                 if c > later_authors.get(a, 0)],
+                [h for h, c in self.commits.items()
+                 if c > later_commits.get(h, 0)])
+
+
+class WindowedFileHistory:
+    """
+    Keeps a FileWindow per file and window. The windows of a file are expired
+    when the file is touched again, and files without any change during the
+    largest window are forgotten, so the state only grows with the recent
+    history and a commit only looks at the recent changes of its files.
+    """
+
+    def __init__(self, windows):
+        self.windows = list(windows)
+        self.files = {}
+        self._updates = 0
+
+    def update(self, commit_hex, commit_time, author, paths):
+        """
+        Add a commit that changed some files and get its windowed features.
+        For each window, these are the number of distinct authors of the files
+        during the window including this commit, the mean time since the
+        previous change of each file that was changed during the window, and
+        the number of distinct earlier commits that changed the files during
+        the window.
+        """
+        cutoff = commit_time - max(self.windows) * SECONDS_PER_DAY
+        cutoffs = [commit_time - days * SECONDS_PER_DAY
+                   for days in self.windows]
+
+        authors = [set([author]) for _ in self.windows]
+        ages = [[] for _ in self.windows]
+        changes = [set() for _ in self.windows]
+
+        for path in paths:
+            state = self.files.get(path)
+            if state is None:
+                state = [None, [FileWindow() for _ in self.windows]]
+                self.files[path] = state
+            last_time, windows = state
+
+            # Later changes are not counted
+            for i, window_cutoff in enumerate(cutoffs):
+                window = windows[i]
+                window.expire(window_cutoff)
+                window_authors, window_commits = \
+                    window.get_distinct(commit_time)
+                authors[i].update(window_authors)
+                changes[i].update(window_commits)
+                if last_time is not None and \
+                   window_cutoff <= last_time <= commit_time:
+                    ages[i].append(commit_time - last_time)
+
+                window.add(commit_hex, commit_time, author)
+            state[0] = commit_time
+
+        self._forget(cutoff)
+
+        features = []
+        for i in range(len(self.windows)):
+            age = float(sum(ages[i])) / len(ages[i]) if ages[i] else 0
+            features.append(str(float(len(authors[i]))))
+            features.append(str(float(age)))
+            features.append(str(float(len(changes[i]))))
+        return features
+
+    def _forget(self, cutoff):
+        """
+        Every now and then, drop the files whose last change is older than the
+        largest window.
+        """
+        self._updates += 1
+        if self._updates % FORGET_INTERVAL != 0:
+            return
+        for path in [p for p, s in self.files.items() if s[0] < cutoff]:
+            del self.files[path]
+
+
+def _count(counter, key, delta):
+    count = counter.get(key, 0) + delta
+    if count:
+        counter[key] = count
+    else:
+        del counter[key]
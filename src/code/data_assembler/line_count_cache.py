@@ -0,0 +1,144 @@
+"""
+Content addressed cache for the number of lines in git blobs.
+"""
+__license__ = "MIT"
+
+import sqlite3
+
+from collections import OrderedDict
+
+DEFAULT_CACHE_SIZE = 65536
+
+# Like git, a blob is binary if there is a NUL byte in its first 8000 bytes
+BINARY_HEADER_SIZE = 8000
+
+# Version 1 added the binary column to the line_counts table
+SCHEMA_VERSION = 1
+
+
+def count_lines(data):
+    """
+    Count the lines of some raw blob data. The count is made directly on the
+    bytes and equals the number of parts the data would be split into on
+    newlines, which is what the feature extractors have always used.
+    """
+    return data.count(b'\n') + 1
+
+
+def is_binary(data):
+    """
+    Check whether some raw blob data is binary by looking at its header only.
+    """
+    return b'\0' in data[:BINARY_HEADER_SIZE]
+
+
+class LineCountCache:
+    """
+    Cache that maps a blob OID to its number of lines and whether it is binary.
+    Blobs are immutable so the OID is a safe key. Lookups first hit a bounded
+    in-memory LRU and then, if a database path is given, an on-disk sqlite
+    table that can be shared between all worker processes. Tables of older
+    versions are migrated when they are opened, and rows that do not know
+    whether their blob is binary are counted again.
+    """
+
+    def __init__(self, repo, max_entries=DEFAULT_CACHE_SIZE, db_path=None,
+                 commit_interval=1000):
+        self.repo = repo
+        self.max_entries = max_entries
+        self.commit_interval = commit_interval
+
+        self._lru = OrderedDict()
+        self._pending = 0
+        self._db = None
+
+        if db_path:
+            self._db = sqlite3.connect(db_path, timeout=60)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._migrate()
+
+    def get(self, oid):
+        """
+        Get the number of lines of the blob with the given OID.
+        """
+        return self._lookup(oid)[0]
+
+    def get_text(self, oid):
+        """
+        Get the number of lines of the blob with the given OID, or None if the
+        blob is binary.
+        """
+        lines, binary = self._lookup(oid)
+        return None if binary else lines
+
+    def close(self):
+        """
+        Flush the pending writes and close the on-disk tier.
+        """
+        if self._db is not None:
+            self._db.commit()
+            self._db.close()
+            self._db = None
+
+    def _migrate(self):
+        # The workers may open the database at the same time
+        self._db.execute("BEGIN IMMEDIATE")
+        version = self._db.execute("PRAGMA user_version").fetchone()[0]
+        self._db.execute("CREATE TABLE IF NOT EXISTS line_counts "
+                         "(oid TEXT PRIMARY KEY, lines INTEGER, "
+                         "binary INTEGER)")
+        if version < 1:
+            columns = [
+                row[1] for row in self._db.execute(
+                    "PRAGMA table_info(line_counts)")
+            ]
+            if "binary" not in columns:
+                self._db.execute(
+                    "ALTER TABLE line_counts ADD COLUMN binary INTEGER")
+        if version < SCHEMA_VERSION:
+            self._db.execute("PRAGMA user_version = {}".format(SCHEMA_VERSION))
+        self._db.commit()
+
+    def _lookup(self, oid):
+        key = str(oid)
+
+        entry = self._lru.get(key)
+        if entry is not None:
+            self._lru.move_to_end(key)
+            return entry
+
+        entry = self._load(key)
+        if entry is None:
+            data = self.repo[oid].data
+            entry = (count_lines(data), is_binary(data))
+            self._store(key, entry)
+
+        self._remember(key, entry)
+        return entry
+
+    def _remember(self, key, entry):
+        self._lru[key] = entry
+        if len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def _load(self, key):
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT lines, binary FROM line_counts WHERE oid = ?",
+            (key, )).fetchone()
+        if row is None or row[1] is None:
+            return None
+        return (row[0], bool(row[1]))
+
+    def _store(self, key, entry):
+        if self._db is None:
+            return
+        self._db.execute(
+            "INSERT OR REPLACE INTO line_counts (oid, lines, binary) "
+            "VALUES (?, ?, ?)", (key, entry[0], int(entry[1])))
+        self._pending += 1
+        if self._pending >= self.commit_interval:
+            self._db.commit()
+            self._pending = 0
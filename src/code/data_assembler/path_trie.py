@@ -0,0 +1,70 @@
+"""
+Interned trie of the directories in a repository.
+"""
+__license__ = "MIT"
+
+from array import array
+
+
+class PathTrie:
+    """
+    Interns every directory of a repository as a node with an integer id. The
+    ancestors of each directory are resolved once and cached, so the
+    subsystems touched by a commit are found with set operations over small
+    tuples of integers instead of building a nested dict for every commit.
+    """
+
+    def __init__(self):
+        self.children = {}
+        self.parents = array('q')
+        self.ancestors = {"": ()}
+
+    def intern(self, parent, name):
+        """
+        Get the id of a directory given the id of its parent (-1 at the root)
+        and its name, adding it to the trie if needed.
+        """
+        key = (parent, name)
+        node = self.children.get(key)
+        if node is None:
+            node = len(self.parents)
+            self.children[key] = node
+            self.parents.append(parent)
+        return node
+
+    def get_ancestors(self, path):
+        """
+        Get the ids of all directories that contain a file, from the top level
+        directory down to the directory of the file.
+        """
+        directory = path.rpartition('/')[0]
+        ancestors = self.ancestors.get(directory)
+        if ancestors is None:
+            parent, _, name = directory.rpartition('/')
+            parent_ancestors = self.get_ancestors(parent + '/')
+            node = self.intern(
+                parent_ancestors[-1] if parent_ancestors else -1, name)
+            ancestors = parent_ancestors + (node, )
+            self.ancestors[directory] = ancestors
+        return ancestors
+
+    def get_depth(self, path):
+        """
+        Get the number of directories above a file, which is 0 for files at
+        the top level.
+        """
+        return len(self.get_ancestors(path))
+
+    def count_touched(self, paths):
+        """
+        Count the number of directories (subsystems) and top level directories
+        (modules) containing a set of files.
+        """
+        subsystems = set()
+        modules = set()
+        for path in paths:
+            ancestors = self.get_ancestors(path)
+            if ancestors:
+                subsystems.update(ancestors)
+                modules.add(ancestors[0])
+        return len(subsystems), len(modules)
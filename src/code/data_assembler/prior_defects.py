@@ -0,0 +1,115 @@
+"""
+Per-file counts of the earlier bug fixing and bug introducing commits, used as
+history features.
+"""
+__license__ = "MIT"
+
+import csv
+import json
+
+from collections import defaultdict
+
+
+def get_prior_defect_header():
+    """
+    Get the csv header of the prior defect features.
+    """
+    header = []
+    for kind in ["fixes", "introducers"]:
+        header.extend([
+            "prior_{}_max".format(kind),
+            "prior_{}_sum".format(kind),
+            "prior_{}_mean".format(kind)
+        ])
+    return header
+
+
+def load_prior_defects(labels_path, pairs_path):
+    """
+    Create a PriorDefects from a labels file made by assemble_labels.py and the
+    bug fix and bug introducing pairs made by the SZZ algorithm.
+    """
+    with open(labels_path, 'r') as inp:
+        introducers = set(
+            row["commit"] for row in csv.DictReader(inp)
+            if row["label"] == "1")
+
+    with open(pairs_path, 'r') as inp:
+        pairs = json.load(inp)
+
+    return PriorDefects(introducers, pairs)
+
+
+class PriorDefects:
+    """
+    Counts, for every file, how many earlier commits that touched it are known
+    to fix a bug and how many are known to introduce one. A fix is known once
+    the fix commit has been walked, and an introducer is only known once the
+    first fix that points it out has been walked, so the counters never use a
+    label that was not yet available. The files of introducers that have not
+    been pointed out yet are kept until their fix comes.
+    """
+
+    def __init__(self, introducers, pairs):
+        self.fixes = set(fix for fix, _ in pairs)
+        self.introducers = set()
+        self.reveals = defaultdict(set)
+        for fix, introducer in pairs:
+            if introducer in introducers:
+                self.introducers.add(introducer)
+                self.reveals[fix].add(introducer)
+
+        self.fix_counts = defaultdict(int)
+        self.introducer_counts = defaultdict(int)
+
+        self._pending = {}
+        self._revealed = set()
+
+    @staticmethod
+    def get_initial_features():
+        """
+        Get the prior defect features of the first commit.
+        """
+        return [str(0.0)] * len(get_prior_defect_header())
+
+    def update(self, commit_hex, names):
+        """
+        Get the prior defect features of a commit that touched some files and
+        then add the labels that become known with the commit. The features
+        are the max, sum and mean of the counts of prior fixes and of prior
+        introducers over the files.
+        """
+        features = _summarize([self.fix_counts.get(n, 0) for n in names])
+        features.extend(
+            _summarize([self.introducer_counts.get(n, 0) for n in names]))
+
+        if commit_hex in self.fixes:
+            for name in names:
+                self.fix_counts[name] += 1
+
+        for introducer in self.reveals.pop(commit_hex, ()):
+            if introducer in self._revealed:
+                continue
+            self._revealed.add(introducer)
+            for name in self._pending.pop(introducer, ()):
+                self.introducer_counts[name] += 1
+
+        if commit_hex in self.introducers:
+            if commit_hex in self._revealed:
+                for name in names:
+                    self.introducer_counts[name] += 1
+            else:
+                self._pending[commit_hex] = list(names)
+
+        return features
+
+
+def _summarize(counts):
+    if not counts:
+        return [str(0.0)] * 3
+    total = sum(counts)
+    return [
+        str(float(max(counts))),
+        str(float(total)),
+        str(float(total) / len(counts))
+    ]
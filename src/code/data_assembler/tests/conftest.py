@@ -0,0 +1,9 @@
+"""
+Makes the scripts of the data assembler importable from the tests.
+"""
+__license__ = "MIT"
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
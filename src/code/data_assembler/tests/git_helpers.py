@@ -0,0 +1,55 @@
+"""
+Helpers to build small git repositories for the tests.
+"""
+__license__ = "MIT"
+
+import os
+import subprocess
+
+BRANCH = "refs/heads/master"
+
+
+def run_git(repo, args, day=1, name="alice"):
+    """
+    Run git in a repository with a fixed person and a fixed date in January
+    2020.
+    """
+    env = dict(os.environ)
+    date = "2020-01-{:02d}T12:00:00+0000".format(day)
+    email = "{}@example.com".format(name)
+    env.update({
+        "GIT_AUTHOR_NAME": name, "GIT_AUTHOR_EMAIL": email,
+        "GIT_COMMITTER_NAME": name, "GIT_COMMITTER_EMAIL": email,
+        "GIT_AUTHOR_DATE": date, "GIT_COMMITTER_DATE": date
+    })
+    return subprocess.check_output(["git", "-C", repo] + args, env=env)
+
+
+def init_repo(repo):
+    """
+    Create an empty repository with a master branch.
+    """
+    subprocess.check_output(["git", "init", "-q", "-b", "master", repo])
+    return repo
+
+
+def write(repo, path, text):
+    """
+    Write a file of the work tree, creating its directories.
+    """
+    path = os.path.join(repo, path)
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as output:
+        output.write(text)
+
+
+def commit_files(repo, files, message, day=1, name="alice"):
+    """
+    Write some files, given as a dict from path to text, and commit all the
+    changes of the work tree.
+    """
+    for path, text in files.items():
+        write(repo, path, text)
+    run_git(repo, ["add", "-A"])
+    run_git(repo, ["commit", "-q", "-m", message], day, name)
@@ -0,0 +1,54 @@
+"""
+Tests of the running experience state against the lists it replaced.
+"""
+__license__ = "MIT"
+
+import random
+
+from assemble_experience_features import update_experience_graph
+from author_experience import (RecentExperience, SubsystemExperience,
+                               get_rrexp)
+
+
+def test_rrexp_matches_shifted_lists():
+    rand = random.Random(1)
+    recent = RecentExperience()
+    rexp = []
+    for i in range(300):
+        files = rand.randint(1, 20)
+        years = 0.0 if i == 0 else float(rand.choice([0, 0, 1, 3, 40]))
+
+        # The recent experience before it was kept as a histogram
+        rexp = [[files, 1.0]] + [[e[0], e[1] + years] for e in rexp]
+        recent.add(files, years)
+
+        assert sum(e[0] for e in recent.get_histogram()) == \
+            sum(e[0] for e in rexp)
+        assert abs(get_rrexp(recent.get_histogram()) - get_rrexp(rexp)) < \
+            1e-9 * get_rrexp(rexp)
+        assert abs(recent.get_rrexp() - get_rrexp(rexp)) < \
+            1e-9 * get_rrexp(rexp)
+    assert max(age for _, age in recent.get_histogram()) > 100
+
+
+def test_sexp_counts_older_changes():
+    subsystem_experience = SubsystemExperience()
+    subsystem_experience.add("alice", ["core/B.java", "web/C.java"])
+    subsystem_experience.add("bob", ["core/A.java"])
+    subsystem_experience.add("alice", ["core/A.java", "core/B.java"])
+    subsystem_experience.add("alice", ["pom.xml"])
+    assert subsystem_experience.get_counts() == [1, 0, 0, 0]
+
+
+def test_nodes_keep_only_rrexp():
+    all_authors, recent_experience = {}, {}
+    subsystem_experience = SubsystemExperience()
+    for i in range(50):
+        node = update_experience_graph(all_authors, recent_experience,
+                                       subsystem_experience, "alice",
+                                       "{:040x}".format(i), ["src/A.java"],
+                                       float(i))
+
+    assert "rexp" not in node
+    assert node["rrexp"] == recent_experience["alice"].get_rrexp()
+    assert len(recent_experience["alice"].buckets) == 50
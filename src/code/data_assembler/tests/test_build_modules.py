@@ -0,0 +1,44 @@
+"""
+Tests of the index of the build modules of a tree.
+"""
+__license__ = "MIT"
+
+from pygit2 import Repository
+
+from build_modules import BuildModuleIndex
+from commit_diffs import get_parent_diff
+from git_helpers import commit_files, init_repo
+
+
+def test_finds_nested_maven_modules(tmpdir):
+    repo = init_repo(str(tmpdir.join("repo")))
+    commit_files(repo, {
+        "README": "readme\n",
+        "a/pom.xml": "<project/>\n",
+        "a/src/A.java": "a\n",
+        "a/b/pom.xml": "<project/>\n",
+        "a/b/src/main/B.java": "b\n",
+        "c/C.java": "c\n"
+    }, "root", day=1)
+    commit_files(repo, {
+        "a/b/d/pom.xml": "<project/>\n",
+        "a/b/d/D.java": "d\n"
+    }, "module", day=2)
+    repo = Repository(repo)
+    child = repo.revparse_single("HEAD")
+    root = child.parents[0]
+
+    index = BuildModuleIndex(repo)
+    index.update(root, *get_parent_diff(repo, root))
+
+    assert index.modules == set(["", "a", "a/b"])
+    assert index.get_module("a/src/A.java") == "a"
+    assert index.get_module("a/b/src/main/B.java") == "a/b"
+    assert index.get_module("c/C.java") == ""
+    assert index.get_module("README") == ""
+
+    index.update(child, *get_parent_diff(repo, child))
+
+    assert index.modules == set(["", "a", "a/b", "a/b/d"])
+    assert index.get_module("a/b/d/D.java") == "a/b/d"
+    assert index.get_module("a/b/src/main/B.java") == "a/b"
@@ -0,0 +1,80 @@
+"""
+Tests of the running file count of the code churns and of the extraction
+of a list of commits.
+"""
+__license__ = "MIT"
+
+import os
+import subprocess
+import sys
+
+import pytest
+from pygit2 import Repository, GIT_SORT_REVERSE, GIT_SORT_TOPOLOGICAL
+
+from assemble_code_churns import FileCounter, count_files, get_commits_churns
+from commit_diffs import LargeCommitGuard, get_parent_diff
+from git_helpers import commit_files, init_repo, run_git
+from line_count_cache import LineCountCache
+
+
+def test_checkpoints_do_not_drift(tmpdir, capsys):
+    path = init_repo(str(tmpdir.join("repo")))
+    commit_files(path, {
+        "README": "readme\n",
+        "core/src/a/A.java": "a\na\na\n",
+        "core/src/b/B.java": "b\nb\n"
+    }, "root", day=1)
+    commit_files(path, {
+        "core/src/a/A.java": "a\n",
+        "web/index.html": "<html>\n</html>\n"
+    }, "change", day=2)
+    run_git(path, ["rm", "-q", "core/src/b/B.java"])
+    run_git(path, ["commit", "-q", "-m", "delete"], day=3)
+
+    repo = Repository(path)
+    commits = list(repo.walk(repo.head.target,
+                             GIT_SORT_TOPOLOGICAL | GIT_SORT_REVERSE))
+    counter = FileCounter(repo, LineCountCache(repo), checkpoint_interval=1,
+                          track_loc=True)
+    for commit in commits:
+        counter.update(commit, *get_parent_diff(repo, commit))
+
+    assert "drifted" not in capsys.readouterr().out
+    assert counter.num_files == count_files(commits[-1].tree, repo) == 3
+    # Lines are counted as the parts between newlines, like everywhere else
+    assert counter.total_loc == 2 + 2 + 3
+
+
+def run_churns(repo, args):
+    script = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                          "assemble_code_churns.py")
+    return subprocess.run([sys.executable, script, "--repository", repo] + args,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+
+
+@pytest.mark.parametrize("option", [["--developer-churns", "dev.json"],
+                                    ["--backend", "git-log"],
+                                    ["--incremental-files"]])
+def test_commits_reject_branch_options(tmpdir, option):
+    repo = init_repo(str(tmpdir.join("repo")))
+    commit_files(repo, {"A.java": "a\n"}, "root")
+    commits = tmpdir.join("commits.txt")
+    commits.write(run_git(repo, ["rev-parse", "HEAD"]).decode())
+
+    result = run_churns(repo, ["--commits", str(commits)] + option)
+
+    assert result.returncode == 2
+    assert "not supported with --commits" in result.stderr
+
+
+def test_commits_flag_large_commits(tmpdir):
+    repo = init_repo(str(tmpdir.join("repo")))
+    commit_files(repo, {"A.java": "a\n"}, "root", day=1)
+    commit_files(repo, {"A.java": "a2\n", "B.java": "b\n"}, "large", day=2)
+    commit_files(repo, {"B.java": "b2\n"}, "small", day=3)
+
+    churns = get_commits_churns(repo, ["HEAD", "HEAD~1"],
+                                guard=LargeCommitGuard(max_files=1))
+
+    assert [row[-1] for row in churns] == ["0", "1"]
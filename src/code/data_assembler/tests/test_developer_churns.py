@@ -0,0 +1,79 @@
+"""
+Tests of the rolling developer churns against sums over all the commits.
+"""
+__license__ = "MIT"
+
+import csv
+import random
+from argparse import ArgumentTypeError
+
+import pytest
+
+from developer_churns import DeveloperChurns
+from time_windows import SECONDS_PER_DAY, parse_windows
+
+WINDOWS = [1, 30, 365]
+
+
+def make_commits(seed, commits=300, authors=4):
+    """
+    Make random commits as author, time, added, deleted and files tuples over
+    about three years.
+    """
+    rand = random.Random(seed)
+    return [("author{}".format(rand.randrange(authors)),
+             rand.randrange(3 * 365 * SECONDS_PER_DAY), rand.randint(0, 50),
+             rand.randint(0, 50), rand.randint(1, 5)) for _ in range(commits)]
+
+
+def read_table(developer_churns, tmpdir):
+    path = str(tmpdir.join("developer_churns.csv"))
+    developer_churns.save(path)
+    with open(path, 'r') as csv_file:
+        return dict(((row["author"], int(row["window_days"])),
+                     [int(row[c]) for c in ["lines_added", "lines_deleted",
+                                            "files_churned", "commits"]])
+                    for row in csv.DictReader(csv_file))
+
+
+def expected_table(commits):
+    end = max(commit[1] for commit in commits)
+    table = {}
+    for author, commit_time, added, deleted, files in commits:
+        for days in WINDOWS:
+            sums = table.setdefault((author, days), [0, 0, 0, 0])
+            if commit_time >= end - days * SECONDS_PER_DAY:
+                for i, value in enumerate([added, deleted, files, 1]):
+                    sums[i] += value
+    return table
+
+
+@pytest.mark.parametrize("order", ["oldest", "newest", "random", "merged"])
+def test_matches_sums_in_any_order(tmpdir, order):
+    commits = make_commits(1)
+    if order == "oldest":
+        commits.sort(key=lambda commit: commit[1])
+    elif order == "newest":
+        commits.sort(key=lambda commit: -commit[1])
+
+    developer_churns = DeveloperChurns(WINDOWS)
+    if order == "merged":
+        # Like the workers of the churn extraction, each with every other
+        # commit
+        for part in (commits[0::2], commits[1::2]):
+            other = DeveloperChurns(WINDOWS)
+            for commit in part:
+                other.add(*commit)
+            developer_churns.update(other.counters)
+    else:
+        for commit in commits:
+            developer_churns.add(*commit)
+
+    assert read_table(developer_churns, tmpdir) == expected_table(commits)
+
+
+def test_parse_windows_rejects_empty_windows():
+    assert parse_windows("30, 90,365,") == [30, 90, 365]
+    for windows in ["30,0", "-7", "30,-1,90"]:
+        with pytest.raises(ArgumentTypeError):
+            parse_windows(windows)
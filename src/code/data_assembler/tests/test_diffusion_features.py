@@ -0,0 +1,49 @@
+"""
+Tests of the diffusion features of the initial commit.
+"""
+__license__ = "MIT"
+
+from assemble_diffusion_features import get_diffusion_features
+from git_helpers import BRANCH, commit_files, init_repo
+
+
+def test_scans_nested_initial_tree(tmpdir):
+    repo = init_repo(str(tmpdir.join("repo")))
+    commit_files(repo, {
+        "README": "readme\n",
+        "core/src/a/A.java": "a\na\na\n",
+        "core/src/b/B.java": "b\nb\n",
+        "web/index.html": "<html>\n"
+    }, "root", day=1)
+    commit_files(repo, {"core/src/a/A.java": "a\n"}, "change", day=2)
+
+    features = get_diffusion_features(repo, BRANCH)
+
+    # The initial commit is last, with the subdirectories below the top
+    # level directories, the top level directories and the entropy of the
+    # lines of its files
+    initial = features[-1]
+    assert initial[1] == 3
+    assert initial[2] == 2
+    assert initial[3] > 0
+
+
+def test_depth_of_changed_files(tmpdir):
+    repo = init_repo(str(tmpdir.join("repo")))
+    commit_files(repo, {
+        "README": "readme\n",
+        "core/src/a/A.java": "a\n",
+        "core/src/b/B.java": "b\n",
+        "web/index.html": "<html>\n",
+        "web/logo.png": "\0png\n"
+    }, "root", day=1)
+    commit_files(repo, {
+        "core/src/a/A.java": "a2\n",
+        "web/index.html": "<html2>\n"
+    }, "change", day=2)
+
+    features = get_diffusion_features(repo, BRANCH, depth=True)
+
+    # Binary files are skipped, like in the entropy
+    assert features[0][4:] == [str(3.0), str(2.0)]
+    assert features[-1][4:] == [str(3.0), str((0 + 3 + 3 + 1) / 4.0)]
@@ -0,0 +1,112 @@
+"""
+Tests of the two backends of the experience features: the files they give to
+a merge commit and the subsystem experience they count.
+"""
+__license__ = "MIT"
+
+import git
+import pytest
+
+from assemble_experience_features import (get_diffing_files,
+                                          get_experience_features,
+                                          get_experience_features_from_log,
+                                          load_experience_features_graph,
+                                          save_experience_features_graph)
+from git_helpers import BRANCH, init_repo, run_git, write
+from git_log_stream import read_name_only_log, read_tree_paths
+
+
+@pytest.fixture
+def merge_repo(tmpdir):
+    """
+    A repository where a side branch that changes lib/ is merged into master
+    after master changed a.txt, followed by one more change of a.txt.
+    """
+    repo = init_repo(str(tmpdir.join("repo")))
+    write(repo, "a.txt", "a\n")
+    write(repo, "lib/b.txt", "b\n")
+    run_git(repo, ["add", "-A"])
+    run_git(repo, ["commit", "-q", "-m", "root"], day=1)
+
+    run_git(repo, ["checkout", "-q", "-b", "side"])
+    write(repo, "lib/b.txt", "b2\n")
+    write(repo, "lib/c.txt", "c\n")
+    run_git(repo, ["add", "-A"])
+    run_git(repo, ["commit", "-q", "-m", "side"], day=2)
+
+    run_git(repo, ["checkout", "-q", "master"])
+    write(repo, "a.txt", "a2\n")
+    run_git(repo, ["commit", "-q", "-am", "master"], day=3)
+    run_git(repo, ["merge", "-q", "--no-ff", "-m", "merge", "side"], day=4)
+    write(repo, "a.txt", "a3\n")
+    run_git(repo, ["commit", "-q", "-am", "after"], day=5)
+    return repo
+
+
+@pytest.fixture
+def linear_repo(tmpdir):
+    """
+    A repository with three commits by the same author to the same file.
+    """
+    repo = init_repo(str(tmpdir.join("linear")))
+    for day in range(1, 4):
+        write(repo, "lib/a.txt", "{}\n".format(day))
+        run_git(repo, ["add", "-A"])
+        run_git(repo, ["commit", "-q", "-m", str(day)], day=day)
+    return repo
+
+
+def get_merge(repo):
+    return git.Repo(repo).commit("HEAD~1").hexsha
+
+
+def test_git_log_diffs_merges_against_first_parent(merge_repo):
+    commits = {c.hex: c for c in read_name_only_log(merge_repo, BRANCH)}
+    assert set(commits[get_merge(merge_repo)].changes) == \
+        set(["lib/b.txt", "lib/c.txt"])
+
+
+def test_gitpython_diffs_merges_against_first_parent(merge_repo):
+    commits = list(git.Repo(merge_repo).iter_commits(BRANCH))
+    assert commits[1].hexsha == get_merge(merge_repo)
+    assert get_diffing_files(commits[1]) == set(["lib/b.txt", "lib/c.txt"])
+    assert get_diffing_files(commits[-1]) == set(["a.txt", "lib/b.txt"])
+
+
+def test_seeds_first_commit_from_tree(merge_repo):
+    assert sorted(read_tree_paths(merge_repo, "HEAD")) == \
+        ["a.txt", "lib/b.txt", "lib/c.txt"]
+
+
+def test_backends_agree_on_merge_rexp(merge_repo, tmpdir, monkeypatch):
+    monkeypatch.chdir(str(tmpdir))
+    graph_path = str(tmpdir.join("author_graph.json"))
+    save_experience_features_graph(merge_repo, BRANCH, graph_path)
+    gitpython = get_experience_features(
+        load_experience_features_graph(graph_path), merge_repo, BRANCH)
+    git_log = get_experience_features_from_log(merge_repo, BRANCH)
+
+    assert gitpython == git_log
+
+    # All changes are from the same year, so rrexp is half the number of
+    # files counted so far: the three files of the seeded tree, then the two
+    # files of the merge against its first parent
+    merge = get_merge(merge_repo)
+    assert dict((row[0], row[1:3]) for row in git_log)[merge] == \
+        [str(2.0), str(2.5)]
+
+
+def get_sexps(repo, tmpdir, monkeypatch):
+    monkeypatch.chdir(str(tmpdir))
+    graph_path = str(tmpdir.join("author_graph.json"))
+    save_experience_features_graph(repo, BRANCH, graph_path)
+    gitpython = get_experience_features(
+        load_experience_features_graph(graph_path), repo, BRANCH)
+    git_log = get_experience_features_from_log(repo, BRANCH)
+    return [[row[3] for row in features] for features in (gitpython, git_log)]
+
+
+def test_sexp_counts_older_changes(linear_repo, tmpdir, monkeypatch):
+    # Rows are newest first, and the newest commit is seeded with its tree
+    for sexps in get_sexps(linear_repo, tmpdir, monkeypatch):
+        assert sexps == [str(0.0), str(1.0), str(0.0)]
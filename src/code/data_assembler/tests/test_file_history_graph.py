@@ -0,0 +1,135 @@
+"""
+Tests of the compact file history graph against the json graph that it
+replaced.
+"""
+__license__ = "MIT"
+
+import os
+import random
+
+import numpy as np
+import pytest
+
+from file_history_graph import (FileHistoryGraph, FileHistoryGraphBuilder,
+                                decode_strings)
+
+
+def make_history(seed, hex_length=40, commits=200, files=30, authors=5):
+    """
+    Make a random history as a list of commits, each a hash, an author and the
+    distinct files that it touched.
+    """
+    rand = random.Random(seed)
+    history = []
+    for i in range(commits):
+        commit_hex = "{:0{}x}".format(i, hex_length)
+        author = "author{}".format(rand.randrange(authors))
+        names = rand.sample(["src/F{}.java".format(f) for f in range(files)],
+                            rand.randint(1, 5))
+        history.append((commit_hex, author, names))
+    return history
+
+
+def build_json_graph(history):
+    """
+    Build the graph like the json graph did: for every file and commit, the
+    previous commit that touched the file and all the authors so far.
+    """
+    all_files = {}
+    for commit_hex, author, names in history:
+        for name in names:
+            node = all_files.setdefault(name, {})
+            last_commit = node.get('lastcommit', "")
+            authors = set([author])
+            if last_commit:
+                authors.update(node[last_commit]["authors"])
+            node[commit_hex] = {"prevcommit": last_commit, "authors": authors}
+            node['lastcommit'] = commit_hex
+    return all_files
+
+
+def check_graph(tmpdir, history, builder, deleted=()):
+    for commit_hex, author, names in history:
+        for name in names:
+            builder.update(name, commit_hex, author)
+            if name in deleted:
+                builder.evict(name)
+    path = str(tmpdir.join("graph"))
+    builder.save(path)
+    graph = FileHistoryGraph(path)
+    author_names = decode_strings(
+        np.load(os.path.join(path, "authors.npy")),
+        np.load(os.path.join(path, "author_offsets.npy")))
+
+    expected = build_json_graph(history)
+    for name, node in expected.items():
+        for commit_hex, _, _ in history:
+            if commit_hex not in node:
+                assert graph.get(name, commit_hex) is None
+                continue
+            prev, author_ids = graph.get(name, commit_hex)
+            assert prev == node[commit_hex]["prevcommit"]
+            assert set(author_names[a] for a in author_ids) == \
+                node[commit_hex]["authors"]
+
+
+def test_matches_json_graph(tmpdir):
+    check_graph(tmpdir, make_history(1), FileHistoryGraphBuilder())
+
+
+def test_matches_json_graph_with_eviction(tmpdir):
+    builder = FileHistoryGraphBuilder(
+        max_active=3, spill_path=str(tmpdir.join("spill")), spill_block=7)
+    check_graph(tmpdir, make_history(2), builder)
+
+
+def test_matches_json_graph_with_deleted_files(tmpdir):
+    builder = FileHistoryGraphBuilder(
+        max_active=5, spill_path=str(tmpdir.join("spill")), spill_block=3)
+    check_graph(tmpdir, make_history(4), builder,
+                deleted=set(["src/F1.java", "src/F2.java"]))
+
+
+def test_matches_json_graph_with_file_ids(tmpdir):
+    history = [(commit_hex, author, [int(n[5:-5]) for n in names])
+               for commit_hex, author, names in make_history(5)]
+    builder = FileHistoryGraphBuilder(
+        max_active=2, spill_path=str(tmpdir.join("spill")), spill_block=11)
+    check_graph(tmpdir, history, builder)
+
+
+def test_update_matches_saved_graph(tmpdir):
+    history = make_history(6)
+    builder = FileHistoryGraphBuilder(
+        max_active=4, spill_path=str(tmpdir.join("spill")), spill_block=5)
+    updates = [(name, commit_hex, builder.update(name, commit_hex, author))
+               for commit_hex, author, names in history for name in names]
+    builder.save(str(tmpdir.join("graph")))
+    graph = FileHistoryGraph(str(tmpdir.join("graph")))
+    for name, commit_hex, update in updates:
+        assert graph.get(name, commit_hex) == update
+
+
+def test_eviction_needs_spill_path():
+    with pytest.raises(ValueError):
+        FileHistoryGraphBuilder(max_active=10)
+
+
+def test_keeps_sha256_hashes(tmpdir):
+    check_graph(tmpdir, make_history(3, hex_length=64, commits=20),
+                FileHistoryGraphBuilder())
+
+
+def test_rebuilds_graph_with_other_keys(tmpdir):
+    history = make_history(7)
+    id_history = [(commit_hex, author, [int(n[5:-5]) for n in names])
+                  for commit_hex, author, names in history]
+    path = str(tmpdir.join("graph"))
+
+    check_graph(tmpdir, id_history, FileHistoryGraphBuilder())
+    check_graph(tmpdir, history, FileHistoryGraphBuilder())
+    assert not os.path.exists(os.path.join(path, "file_keys.npy"))
+
+    check_graph(tmpdir, id_history, FileHistoryGraphBuilder())
+    assert not os.path.exists(os.path.join(path, "paths.npy"))
+    assert not os.path.exists(os.path.join(path, "path_offsets.npy"))
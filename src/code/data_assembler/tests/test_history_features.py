@@ -0,0 +1,50 @@
+"""
+Tests of the history features of a graph seeded with the initial tree.
+"""
+__license__ = "MIT"
+
+from pygit2 import Repository
+
+from assemble_history_features import (get_files_in_tree,
+                                       get_history_features_fused)
+from git_helpers import BRANCH, commit_files, init_repo
+from line_count_cache import LineCountCache
+
+
+def make_repo(tmpdir):
+    """
+    Make a repository with java files in nested directories of its root tree,
+    and a later change of one of them by another author.
+    """
+    repo = init_repo(str(tmpdir.join("repo")))
+    commit_files(repo, {
+        "README": "readme\n",
+        "core/src/a/A.java": "a\na\n",
+        "core/src/b/B.java": "b\n",
+        "core/lib/Blob.java": "\0binary\n"
+    }, "root", day=1, name="alice")
+    commit_files(repo, {"core/src/a/A.java": "a\n"}, "change", day=3,
+                 name="bob")
+    return repo
+
+
+def test_finds_nested_java_files(tmpdir):
+    repo = Repository(make_repo(tmpdir))
+    root = repo.revparse_single("HEAD~1")
+    line_cache = LineCountCache(repo)
+
+    names = [name for (_, name) in
+             get_files_in_tree(root.tree, repo, line_cache)]
+
+    assert sorted(names) == ["core/src/a/A.java", "core/src/b/B.java"]
+
+
+def test_seeds_history_with_initial_tree(tmpdir):
+    features = get_history_features_fused(make_repo(tmpdir), BRANCH)
+
+    # The change of a file of the root tree sees its first author, the age
+    # of its last change in seconds and that change
+    change = features[-1]
+    assert float(change[1]) == 2.0
+    assert float(change[2]) == 2 * 86400.0
+    assert float(change[3]) == 1.0
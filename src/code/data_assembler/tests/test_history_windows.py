@@ -0,0 +1,84 @@
+"""
+Tests of the sliding window history features against a rescan of every
+earlier change.
+"""
+__license__ = "MIT"
+
+import random
+
+from history_windows import WindowedFileHistory
+from time_windows import SECONDS_PER_DAY
+
+
+def get_rescanned_features(history, windows):
+    """
+    Get the windowed features of every commit by looking at every earlier
+    change of its files.
+    """
+    events = {}
+    features = []
+    for commit_hex, commit_time, author, paths in history:
+        commit_feat = []
+        for days in windows:
+            cutoff = commit_time - days * SECONDS_PER_DAY
+            authors = set([author])
+            changes = set()
+            ages = []
+            for path in paths:
+                path_events = events.get(path, [])
+                for event_hex, event_time, event_author in path_events:
+                    if cutoff <= event_time <= commit_time:
+                        authors.add(event_author)
+                        changes.add(event_hex)
+                if path_events and \
+                   cutoff <= path_events[-1][1] <= commit_time:
+                    ages.append(commit_time - path_events[-1][1])
+            age = float(sum(ages)) / len(ages) if ages else 0
+            commit_feat.extend([str(float(len(authors))), str(float(age)),
+                                str(float(len(changes)))])
+        features.append(commit_feat)
+        for path in paths:
+            events.setdefault(path, []).append(
+                (commit_hex, commit_time, author))
+    return features
+
+
+def make_history(seed, skew=0):
+    """
+    Make a random history of commits a few days apart. With a skew, commit
+    times are moved back by up to that many days.
+    """
+    rand = random.Random(seed)
+    history = []
+    commit_time = 0
+    for i in range(500):
+        commit_time += rand.randint(0, 5 * SECONDS_PER_DAY)
+        history.append((
+            "{:040x}".format(i),
+            commit_time - rand.randint(0, skew * SECONDS_PER_DAY),
+            "author{}".format(rand.randrange(6)),
+            rand.sample(["F{}.java".format(f) for f in range(20)],
+                        rand.randint(1, 4))))
+    return history
+
+
+def test_matches_rescan():
+    windows = [7, 30, 90]
+    history = make_history(1)
+    windowed = WindowedFileHistory(windows)
+    features = [windowed.update(*commit) for commit in history]
+    assert features == get_rescanned_features(history, windows)
+
+
+def test_skips_later_changes():
+    windows = [30]
+    history = [
+        ("a", 10 * SECONDS_PER_DAY, "alice", ["F.java"]),
+        ("b", 5 * SECONDS_PER_DAY, "bob", ["F.java"]),
+        ("c", 12 * SECONDS_PER_DAY, "carol", ["F.java"]),
+    ]
+    windowed = WindowedFileHistory(windows)
+    features = [windowed.update(*commit) for commit in history]
+    assert features == get_rescanned_features(history, windows)
+    assert features[1] == [str(1.0), str(0.0), str(0.0)]
+    assert features[2] == [str(3.0), str(7.0 * SECONDS_PER_DAY), str(2.0)]
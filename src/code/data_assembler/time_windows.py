@@ -0,0 +1,36 @@
+"""
+Helpers for time spans that are given in days.
+"""
+__license__ = "MIT"
+
+from argparse import ArgumentTypeError
+
+SECONDS_PER_DAY = 86400
+
+
+def parse_days(value):
+    """
+    Parse a positive number of days given on the command line.
+    """
+    days = float(value)
+    if days <= 0:
+        raise ArgumentTypeError(
+            "{} is not a positive number of days".format(value))
+    return days
+
+
+def parse_windows(windows):
+    """
+    Parse a comma separated list of positive window sizes in days given on
+    the command line.
+    """
+    sizes = []
+    for size in windows.split(','):
+        if not size.strip():
+            continue
+        days = int(size)
+        if days <= 0:
+            raise ArgumentTypeError(
+                "{} is not a positive number of days".format(size.strip()))
+        sizes.append(days)
+    return sizes